@@ -21,6 +21,14 @@ from pymongo import MongoClient, ReplaceOne # Necessary for background_scanner
 from asyncio import QueueEmpty
 import pytz 
 from typing import List, Dict, Optional
+import sys
+# Shared modules (records.py, ...) live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from records import heatmap_records, insert_documents
+from context_publisher import ContextPublisher
+from instrument_map import InstrumentMap
+import enrichment
+from http_session import session_for
 # Placeholder for the Squeeze Screener library:
 from tradingview_screener import Query, col, And, Or 
 
@@ -37,6 +45,7 @@ SQUEEZE_CONTEXT_COLLECTION_NAME = LIVE_WSS_CLIENT_n_ANOMALY_DETECTOR.SQUEEZE_CON
 # NEW: Collection for storing the history of all squeeze events 
 SQUEEZE_HISTORY_COLLECTION_NAME = "squeeze_history_mongo" 
 FIRED_EVENTS_COLLECTION_NAME = "fired_events_mongo"
+FIRED_EVENTS_BATCH_SIZE = 1000
 
 
 
@@ -97,6 +106,19 @@ connect_db()
 fired_events_collection = db[FIRED_EVENTS_COLLECTION_NAME] 
 squeeze_context_collection = db[SQUEEZE_CONTEXT_COLLECTION_NAME]
 squeeze_history_collection = db[SQUEEZE_HISTORY_COLLECTION_NAME] 
+
+def load_instrument_keys():
+    _, name_to_instrument, _ = LIVE_WSS_CLIENT_n_ANOMALY_DETECTOR.create_bidirectional_mapping()
+    return name_to_instrument
+
+# With an instrument master file, symbols resolve through a memory-mapped table that reloads
+# when the file changes; otherwise through the WSS client's mapping, cached between sweeps
+INSTRUMENT_MASTER_FILE = os.environ.get('INSTRUMENT_MASTER_FILE')
+instrument_map = InstrumentMap(INSTRUMENT_MASTER_FILE) if INSTRUMENT_MASTER_FILE else None
+
+# Keeps the instrument mapping and the last published documents between sweeps
+context_publisher = ContextPublisher(squeeze_context_collection, load_instrument_keys, instruments=instrument_map) if squeeze_context_collection is not None else None
+
 # --- PERSISTENCE FUNCTIONS (MongoDB Replacements) ---
 
 def load_previous_squeeze_list_from_mongo():
@@ -181,33 +203,10 @@ def save_fired_events_to_mongo(fired_events_df: pd.DataFrame):
         return
         
     try:
-        # Convert DataFrame to list of dictionaries
-        data_to_insert = fired_events_df.to_dict('records')
-        
-        # Convert pandas/numpy types to native Python types for MongoDB
-        for doc in data_to_insert:
-            if 'fired_timestamp' in doc and pd.notna(doc['fired_timestamp']):
-                # Ensure it's a datetime object, converting from pandas Timestamp if necessary
-                if isinstance(doc['fired_timestamp'], pd.Timestamp):
-                    doc['fired_timestamp'] = doc['fired_timestamp'].to_pydatetime()
-            
-            # Convert boolean and float types, replace NaN with None
-            for key, value in doc.items():
-                if isinstance(value, (np.bool_, bool)):
-                    doc[key] = bool(value)
-                elif isinstance(value, (np.generic, float)) and np.isnan(value):
-                    doc[key] = None # CRITICAL FIX: Replace NaN with None for MongoDB
-                elif isinstance(value, (np.generic, float)):
-                    doc[key] = float(value)
-                elif pd.isna(value):
-                    doc[key] = None # MongoDB prefers None over NaN
-        
-        # Filter out documents where 'ticker' is missing (shouldn't happen, but safety measure)
-        data_to_insert = [doc for doc in data_to_insert if doc.get('ticker')]
-
-        if data_to_insert:
-            fired_events_collection.insert_many(data_to_insert, ordered=False)
-            print(f"Saved {len(data_to_insert)} fired events to {FIRED_EVENTS_COLLECTION_NAME}.")
+        # Types are coerced per column and documents streamed in fixed-size batches (records.py)
+        inserted = insert_documents(fired_events_collection, fired_events_df, batch_size=FIRED_EVENTS_BATCH_SIZE)
+        if inserted:
+            print(f"Saved {inserted} fired events to {FIRED_EVENTS_COLLECTION_NAME}.")
         
     except Exception as e:
         print(f"ERROR saving fired events to MongoDB: {e}")
@@ -325,82 +324,19 @@ def save_squeeze_context_to_mongodb(dfs_dict: dict):
     
     This replaces the document for each instrument_key with the latest status.
     """
-    if squeeze_context_collection is None:
+    if context_publisher is None:
         print("MongoDB connection failed. Cannot save squeeze context.")
         return
 
-    # 1. CONSOLIDATE DATA INTO A SINGLE DATAFRAME FOR MAPPING
-    df_in_squeeze = dfs_dict.get("in_squeeze", pd.DataFrame()).copy()
-    df_fired = dfs_dict.get("fired", pd.DataFrame()).copy()
-    
-    # 1a. Mark context explicitly
-    if not df_in_squeeze.empty:
-        df_in_squeeze['is_in_squeeze'] = True
-    if not df_fired.empty and not df_in_squeeze.empty:
-        df_fired['is_in_squeeze'] = False
-        # Remove symbols in df_fired that are still in df_in_squeeze
-        df_fired = df_fired[~df_fired['ticker'].isin(df_in_squeeze['ticker'])]
-    
-    final_df = pd.concat([df_in_squeeze, df_fired], ignore_index=True)
-
-    if final_df.empty:
-        print(" !! Squeeze scan returned no data to save to context DB.")
-        return
-    
-    # result_dict  = final_df.to_dict(orient='dict')
-    # 2. USE EXISTING API TO FORMAT DATA
-
-    context_data_list = generate_heatmap_data((final_df) )
-
-    # 3. MAP SYMBOL ('name') TO CORE INSTRUMENT ID AND PREPARE BULK WRITE
-    operations = []
-    
-    instrument_to_name, name_to_instrument , name_to_tradingSymbol = LIVE_WSS_CLIENT_n_ANOMALY_DETECTOR.create_bidirectional_mapping() 
-    # for doc in context_data_list:
-    for doc in context_data_list:
-        symbol_NSE = str(doc.get('name') )
-        if ":" in symbol_NSE :
-            symbol = symbol_NSE.split(":")[1] # e.g., 'AXISBANK'
-        else :
-            symbol = symbol_NSE
-            
-        # Get the CORE ID (e.g., NSE_EQ|INE614G01033)
-        core_instrument_id = name_to_instrument.get(symbol,symbol_NSE) 
-
-        if core_instrument_id.startswith(symbol):
-            print(f"Skipping {symbol}: Instrument key mapping failed.")
-            continue
-            
-        # KEY CHANGE 1: Set the identifier field to "ticker" (WSS key)
-        doc['ticker'] = core_instrument_id 
-        
-        # **CRITICAL ADDITION:** Set the human-readable name for API/UI use
-        doc['tradingname'] = symbol # e.g., 'AXISBANK'
-        
-        # Ensure the 'is_in_squeeze' boolean status is available
-        status_row = final_df[final_df['ticker'] == symbol].iloc[0] if symbol in final_df['ticker'].values else None
-        if status_row is not None:
-             doc['is_in_squeeze'] = bool(status_row.get('is_in_squeeze', False))
-             
-        # Cleanup: Remove the symbol field if you don't need it for the WSS client
-        #doc.pop('name', None) 
-
-        # KEY CHANGE 2: Filter the upsert operation using the "ticker" field
-        op = ReplaceOne(
-            {'ticker': core_instrument_id}, # Filter on the "ticker" field
-            doc, 
-            upsert=True
-        )
-        operations.append(op)
-
-    # 4. EXECUTE BULK WRITE
-    if operations:
-        try:
-            print( f" WRITING TO {SQUEEZE_CONTEXT_COLLECTION_NAME} COLLECTION ")
-            result = squeeze_context_collection.bulk_write(operations, ordered=False)
-            print(f"MongoDB context update complete. Saved/Updated {result.upserted_count + result.modified_count} instruments to squeeze_context.")
-        except Exception as e:
-            print(f"ERROR during MongoDB bulk write: {e}")
+    # Symbol rows are mapped in one pass and only changed documents are written (context_publisher.py)
+    try:
+        sent = context_publisher.publish(dfs_dict)
+        print(f"MongoDB context update complete. Sent {sent} changed instruments to {SQUEEZE_CONTEXT_COLLECTION_NAME}.")
+        if instrument_map is not None:
+            stats = instrument_map.stats()
+            print(f"Instrument map: {stats['misses']}/{stats['lookups']} lookups missed ({stats['miss_rate']:.1%}); top misses: {stats['top_misses'][:5]}")
+    except Exception as e:
+        print(f"ERROR during MongoDB bulk write: {e}")
             
 class CustomJSONEncoder(simplejson.JSONEncoder):
     def default(self, obj):
@@ -449,6 +385,8 @@ try:
     print("Successfully loaded TradingView cookies.")
 except Exception as e:
     print(f"Warning: Could not load TradingView cookies. Scanning will be disabled. Error: {e}")
+# Both scan queries reuse one keep-alive session that holds the cookie jar
+scanner_session = session_for(cookies)
 
 
 # --- Timeframe Configuration ---
@@ -495,44 +433,10 @@ def generate_heatmap_data(df ):
         raise TypeError(f"Expected dict or pandas.DataFrame, got {type(df)}")
     
 
-    for c in ['ticker', 'HeatmapScore', 'SqueezeCount', 'rvol', 'URL', 'logo', 'momentum', 'highest_tf', 'squeeze_strength']:
-        if c not in df.columns:
-            # Note: This assigns 'N/A' or 0 to the entire new column
-            df[c] = 'N/A' if c in ['momentum', 'highest_tf', 'squeeze_strength'] else 0
-
-    heatmap_data = []
-    # print(df.head())
-    for index, row in df.iterrows():
-        stock_data = {
-            "name": row['ticker'],
-            # Ensure proper handling of potential NaN values on the way out
-            "value": row['HeatmapScore'] if pd.notna(row['HeatmapScore']) else None, 
-            "count": row.get('SqueezeCount', 0) if pd.notna(row.get('SqueezeCount', 0)) else 0,
-            "rvol": row['rvol'] if pd.notna(row['rvol']) else None,
-            "url": row['URL'],
-            "logo": row['logo'],
-            "momentum": row['momentum'] if pd.notna(row['momentum']) else None,
-            "highest_tf": row['highest_tf'] if pd.notna(row['highest_tf']) else None,
-            "squeeze_strength": row['squeeze_strength'] if pd.notna(row['squeeze_strength']) else None
-        }
-        
-        # Handle optional columns with NaN checks
-        for col_name in ['fired_timeframe', 'previous_volatility', 'current_volatility', 'volatility_increased']:
-            if col_name in df.columns:
-                stock_data[col_name] = row[col_name] if pd.notna(row[col_name]) else None
-
-        if 'fired_timestamp' in df.columns and pd.notna(row['fired_timestamp']):
-            stock_data['fired_timestamp'] = row['fired_timestamp'].isoformat() if isinstance(row['fired_timestamp'], datetime) else str(row['fired_timestamp'])
-
-        heatmap_data.append(stock_data)
-    return heatmap_data
-
+    # Converted column by column; see records.py for the field mapping and benchmark
+    return heatmap_records(df)
 
 
-def get_highest_squeeze_tf(row):
-    for tf_suffix in sorted(tf_order_map, key=tf_order_map.get, reverse=True):
-        if row.get(f'InSqueeze{tf_suffix}', False): return tf_display_map[tf_suffix]
-    return 'Unknown'
 
 def get_dynamic_rvol(row, timeframe_name, tf_suffix_map):
     tf_suffix = tf_suffix_map.get(timeframe_name)
@@ -542,65 +446,16 @@ def get_dynamic_rvol(row, timeframe_name, tf_suffix_map):
     if pd.isna(volume) or pd.isna(avg_volume) or avg_volume == 0: return 0
     return volume / avg_volume
 
-def get_dynamic_rvol_for_fired(row):
-    """
-    Calculates RVOL for a FIRED event using un-suffixed volume columns.
-    Assumes columns 'volume' and 'average_volume_10d_calc' exist in the simplified Fired DF.
-    """
-    volume = row.get('volume')
-    avg_volume = row.get('average_volume_10d_calc')
-    if pd.isna(volume) or pd.isna(avg_volume) or avg_volume == 0: return 0
-    return volume / avg_volume
-
-def get_squeeze_strength(row):
-    highest_tf_name = row['highest_tf']
-    tf_suffix = tf_suffix_map.get(highest_tf_name)
-    if tf_suffix is None: return "N/A"
-    bb_upper, bb_lower = row.get(f'BB.upper{tf_suffix}'), row.get(f'BB.lower{tf_suffix}')
-    kc_upper, kc_lower = row.get(f'KltChnl.upper{tf_suffix}'), row.get(f'KltChnl.lower{tf_suffix}')
-    if any(pd.isna(val) for val in [bb_upper, bb_lower, kc_upper, kc_lower]): return "N/A"
-    bb_width, kc_width = bb_upper - bb_lower, kc_upper - kc_lower
-    if bb_width == 0: return "N/A"
-    sqz_strength = kc_width / bb_width
-    if sqz_strength >= 2: return "VERY STRONG"
-    elif sqz_strength >= 1.5: return "STRONG"
-    elif sqz_strength > 1: return "Regular"
-    else: return "N/A"
-
 def process_fired_events(events, tf_order_map, tf_suffix_map):
     if not events: return pd.DataFrame()
     df = pd.DataFrame(events)
-    def get_tf_sort_key(display_name):
-        suffix = tf_suffix_map.get(display_name, '')
-        return tf_order_map.get(suffix, -1)
-    df['tf_order'] = df['fired_timeframe'].apply(get_tf_sort_key)
-    processed_events = []
-    for ticker, group in df.groupby('ticker'):
-        # Get the event from the highest timeframe that fired
-        highest_tf_event = group.loc[group['tf_order'].idxmax()]
-        consolidated_event = highest_tf_event.to_dict()
-        # Count how many timeframes fired
-        consolidated_event['SqueezeCount'] = group['fired_timeframe'].nunique()
-        consolidated_event['highest_tf'] = highest_tf_event['fired_timeframe']
-        processed_events.append(consolidated_event)
-    return pd.DataFrame(processed_events)
-
-def get_fired_breakout_direction_for_fired(row):
-    """
-    Determines breakout direction for a FIRED event using un-suffixed indicator columns
-    from the simplified Fired DF.
-    """
-    # Columns are now un-suffixed for the simplification logic
-    close, bb_upper, kc_upper = row.get('close'), row.get('BB.upper'), row.get('KltChnl.upper')
-    bb_lower, kc_lower = row.get('BB.lower'), row.get('KltChnl.lower')
-    
-    if any(pd.isna(val) for val in [close, bb_upper, kc_upper, bb_lower, kc_lower]): return 'Neutral'
-    
-    # Bullish: Close > BB Upper AND BB Upper > KC Upper (Volatility expansion)
-    if close > bb_upper and bb_upper > kc_upper: return 'Bullish'
-    # Bearish: Close < BB Lower AND BB Lower < KC Lower
-    elif close < bb_lower and bb_lower < kc_lower: return 'Bearish'
-    else: return 'Neutral'
+    df['tf_order'] = df['fired_timeframe'].map(tf_suffix_map).fillna('').map(tf_order_map).fillna(-1)
+    # Count how many timeframes fired, then keep each ticker's event from the highest timeframe
+    squeeze_counts = df.groupby('ticker')['fired_timeframe'].nunique()
+    df = df.sort_values('tf_order', ascending=False, kind='stable').drop_duplicates(subset=['ticker'])
+    df['SqueezeCount'] = df['ticker'].map(squeeze_counts)
+    df['highest_tf'] = df['fired_timeframe']
+    return df.sort_values('ticker').reset_index(drop=True)
 
 def ensure_scalar_columns(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -658,7 +513,7 @@ def run_scan(settings):
         ]
         query_in_squeeze = Query().select(*select_cols).where2(And(*filters)).set_markets(settings['market'])
 
-        _, df_in_squeeze = query_in_squeeze.get_scanner_data(cookies=cookies)
+        _, df_in_squeeze = scanner_session.get_scanner_data(query_in_squeeze)
 
         print(f"Found {len(df_in_squeeze) if df_in_squeeze is not None else 0} stocks currently in a squeeze.")
         #print(df_in_squeeze)
@@ -687,13 +542,15 @@ def run_scan(settings):
             for tf in timeframes:
                 df_in_squeeze[f'InSqueeze{tf}'] = (df_in_squeeze[f'BB.upper{tf}'] < df_in_squeeze[f'KltChnl.upper{tf}']) & (df_in_squeeze[f'BB.lower{tf}'] > df_in_squeeze[f'KltChnl.lower{tf}'])
             df_in_squeeze['SqueezeCount'] = df_in_squeeze[[f'InSqueeze{tf}' for tf in timeframes]].sum(axis=1)
-            df_in_squeeze['highest_tf'] = df_in_squeeze.apply(get_highest_squeeze_tf, axis=1)
-            df_in_squeeze['squeeze_strength'] = df_in_squeeze.apply(get_squeeze_strength, axis=1)
-            df_in_squeeze = df_in_squeeze[df_in_squeeze['squeeze_strength'].isin(['STRONG', 'VERY STRONG'])]
-            df_in_squeeze['rvol'] = df_in_squeeze.apply(lambda row: get_dynamic_rvol(row, row['highest_tf'], tf_suffix_map), axis=1)
-            df_in_squeeze['momentum'] = df_in_squeeze['MACD.hist'].apply(lambda x: 'Bullish' if x > 0 else 'Bearish' if x < 0 else 'Neutral')
-            volatility_map = {(ticker, tf): vol for ticker, tf, vol in current_squeeze_pairs}
-            df_in_squeeze['volatility'] = df_in_squeeze.apply(lambda row: volatility_map.get((row['ticker'], row['highest_tf']), 0), axis=1)
+            # Whole-column enrichment on the highest timeframe in a squeeze (enrichment.py)
+            ranked_tfs = sorted(timeframes, key=tf_order_map.get, reverse=True)
+            squeeze_tf = enrichment.highest_timeframe({tf: df_in_squeeze[f'InSqueeze{tf}'].to_numpy() for tf in ranked_tfs})
+            df_in_squeeze['highest_tf'] = pd.Series(squeeze_tf, index=df_in_squeeze.index).map(tf_display_map).fillna('Unknown')
+            df_in_squeeze['squeeze_strength'] = enrichment.select_by_timeframe(df_in_squeeze, squeeze_tf, enrichment.squeeze_strength, ranked_tfs, 'N/A')
+            df_in_squeeze['rvol'] = enrichment.select_by_timeframe(df_in_squeeze, squeeze_tf, enrichment.relative_volume, ranked_tfs)
+            df_in_squeeze['volatility'] = enrichment.select_by_timeframe(df_in_squeeze, squeeze_tf, lambda df, tf: enrichment.squeeze_state(df, tf)[2], ranked_tfs)
+            df_in_squeeze = df_in_squeeze[df_in_squeeze['squeeze_strength'].isin(enrichment.STRONG_SQUEEZES)]
+            df_in_squeeze['momentum'] = enrichment.momentum(df_in_squeeze)
             df_in_squeeze['HeatmapScore'] = df_in_squeeze['rvol'] * df_in_squeeze['momentum'].map({'Bullish': 1, 'Neutral': 0.5, 'Bearish': -1}) * df_in_squeeze['volatility']
 
             # Create records for saving to squeeze_history_mongo
@@ -735,7 +592,7 @@ def run_scan(settings):
            
             query_fired = Query().select(*select_cols).set_tickers(*fired_tickers)
             # .where2(And(*filters)).set_markets(settings['market'])
-            _, df_fired = query_fired.get_scanner_data(cookies=cookies)
+            _, df_fired = scanner_session.get_scanner_data(query_fired)
 
             if df_fired is not None and not df_fired.empty:
                 newly_fired_events = []
@@ -802,8 +659,8 @@ def run_scan(settings):
                     df_newly_fired['logo'] = df_newly_fired['logoid'].apply(lambda x: f"https://s3-symbol-logo.tradingview.com/{x}.svg" if pd.notna(x) and x.strip() else '')
                     
                     # Use the new helper functions that look for un-suffixed columns
-                    df_newly_fired['rvol'] = df_newly_fired.apply(get_dynamic_rvol_for_fired, axis=1)
-                    df_newly_fired['momentum'] = df_newly_fired.apply(get_fired_breakout_direction_for_fired, axis=1)
+                    df_newly_fired['rvol'] = enrichment.relative_volume(df_newly_fired, '')
+                    df_newly_fired['momentum'] = enrichment.breakout_direction(df_newly_fired, '')
                     
                     df_newly_fired['squeeze_strength'] = np.where(df_newly_fired['confluence'], 'FIRED (Confluence)', 'FIRED')
                     df_newly_fired['HeatmapScore'] = df_newly_fired['rvol'] * df_newly_fired['momentum'].map({'Bullish': 1, 'Neutral': 0.5, 'Bearish': -1}) * df_newly_fired['current_volatility']
@@ -823,8 +680,8 @@ def run_scan(settings):
             # Re-apply enrichment fields lost during consolidation
             df_recent_fired_processed['URL'] = "https://in.tradingview.com/chart/N8zfIJVK/?symbol=" + df_recent_fired_processed['ticker'].apply(urllib.parse.quote)
             df_recent_fired_processed['logo'] = df_recent_fired_processed['logoid'].apply(lambda x: f"https://s3-symbol-logo.tradingview.com/{x}.svg" if pd.notna(x) and x.strip() else '')
-            df_recent_fired_processed['rvol'] = df_recent_fired_processed.apply(get_dynamic_rvol_for_fired, axis=1)
-            df_recent_fired_processed['momentum'] = df_recent_fired_processed.apply(get_fired_breakout_direction_for_fired, axis=1)
+            df_recent_fired_processed['rvol'] = enrichment.relative_volume(df_recent_fired_processed, '')
+            df_recent_fired_processed['momentum'] = enrichment.breakout_direction(df_recent_fired_processed, '')
             df_recent_fired_processed['squeeze_strength'] = np.where(df_recent_fired_processed['confluence'], 'FIRED (Confluence)', 'FIRED')
             df_recent_fired_processed['HeatmapScore'] = df_recent_fired_processed['rvol'] * df_recent_fired_processed['momentum'].map({'Bullish': 1, 'Neutral': 0.5, 'Bearish': -1}) * df_recent_fired_processed['current_volatility']
 
@@ -12,6 +12,10 @@ from tradingview_screener import Query, col, And, Or
 import sqlite3, os, json, logging
 import pandas as pd
 from datetime import datetime, timezone
+import sys
+# Shared modules (query_cache.py, ...) live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from query_cache import QueryCache
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -32,6 +36,9 @@ VOLUME_THRESHOLDS = {
 
 timeframes = ['',   '|5', '|15', '|30', '|60', '|120', '|240', '|1W', '|1M']
 
+# Repeated /scan calls with the same parameters are answered from memory until the next 5m bar
+query_cache = QueryCache()
+
 # -------------------- DB --------------------
 def get_db():
     db = getattr(g, '_database', None)
@@ -112,7 +119,7 @@ def run_multi_tf_scan(market, params, cookies=None):
     q = build_multi_tf_query(market, params)
     # print(q)
     try:
-        total, df = q.get_scanner_data(cookies=cookies)
+        total, df = query_cache.get_scanner_data(q, timeframes, cookies=cookies)
     except Exception as e:
         return {'error': str(e)}
     if df is None or df.empty:
@@ -1,11 +1,24 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from tradingview_screener import Query, col, And, Or
 import pandas as pd
 from datetime import datetime, timezone
 import threading
-from time import sleep
+from time import sleep, perf_counter
 import os
 import rookiepy
+from fired_events import FiredEventStore
+from snapshot import build_snapshot
+from stream import SweepBroadcaster
+from storage import SweepStore
+from scan import timeframes, tf_suffix_map, tf_display_map, base_filters
+from market_calendar import get_calendar
+from scheduler import BarCloseScheduler
+from transitions import TransitionTracker
+from query_cache import QueryCache
+from http_session import session_stats
+from executor import QueryExecutor
+from universe import Universe
+from state_matrix import SIGNALS, StateMatrix
 
 app = Flask(__name__)
 
@@ -16,7 +29,11 @@ scanner_settings = {
     "min_price": 20,
     "max_price": 10000,
     "min_volume": 500000,
-    "min_value_traded": 10000000
+    "min_value_traded": 10000000,
+    "scan_mode": "concurrent",
+    "max_concurrency": 5,
+    "shard_size": 500,
+    "query_timeout": 20
 }
 
 cookies = None
@@ -26,24 +43,53 @@ try:
 except Exception as e:
     print(f"Warning: Could not load TradingView cookies. Scanning will be disabled. Error: {e}")
 
+# Fired events are kept for a trading day, capped so a noisy session cannot grow without bound
+FIRED_EVENT_RETENTION_SECONDS = 24 * 60 * 60
+FIRED_EVENT_CAP = 50000
+
 class AppState:
     def __init__(self):
-        self.all_fired_events = []
+        self.fired_events = FiredEventStore(max_events=FIRED_EVENT_CAP, retention_seconds=FIRED_EVENT_RETENTION_SECONDS)
         self.latest_scan_results = {"fired": pd.DataFrame()}
+        self.latest_snapshot = build_snapshot(self.latest_scan_results)
 
     def add_fired_events(self, new_fired_events):
-        self.all_fired_events.extend(new_fired_events)
+        self.fired_events.add(new_fired_events)
 
-    def get_all_fired_events(self):
-        return self.all_fired_events
+    def select_fired_events(self, since=None, since_ts=None, symbol=None, timeframe=None):
+        return self.fired_events.select(since=since, since_ts=since_ts, symbol=symbol, timeframe=timeframe)
 
-    def set_latest_scan_results(self, results):
+    def set_latest_scan_results(self, results, snapshot=None):
         self.latest_scan_results = results
+        self.latest_snapshot = snapshot or build_snapshot(results)
 
     def get_latest_scan_results(self):
         return self.latest_scan_results
 
+    def get_latest_snapshot(self):
+        return self.latest_snapshot
+
 app_state = AppState()
+broadcaster = SweepBroadcaster()
+scheduler = BarCloseScheduler(timeframes, get_calendar(scanner_settings['market']))
+sweep_store = SweepStore()
+# Identical queries are answered from memory until their bars close
+query_cache = QueryCache(scheduler.calendar)
+# Rate limit, retries with backoff and a circuit breaker in front of every scan query
+query_executor = QueryExecutor()
+# Symbols passing the base filters, resolved once per session and restricted to with set_tickers
+universe = Universe(base_filters, path=os.environ.get('UNIVERSE_FILE', 'universe.json'),
+                    calendar=scheduler.calendar, fetch=query_executor.get_scanner_data)
+# Timeframes whose last scan failed -> error; they keep their previous result and are retried
+stale_timeframes = {}
+# Per-symbol bitmasks of each signal across timeframes, for /confluence
+state_matrix = StateMatrix()
+# Column projection of the latest sweep, and estimated response bytes saved since start-up
+projection_stats = {"last": None, "bytes_saved": 0}
+# Pause between retries of failed timeframes, at least as long as an open breaker stays open
+STALE_RETRY_SECONDS = 15
+# Squeeze state survives restarts through a local checkpoint, written off the scanner thread
+squeeze_tracker = TransitionTracker(timeframes, checkpoint_path=os.environ.get('SQUEEZE_STATE_FILE', 'squeeze_state.npz'))
 
 @app.route('/')
 def index():
@@ -51,22 +97,102 @@ def index():
 
 @app.route('/get_latest_data', methods=['GET'])
 def get_latest_data():
-    """Returns the latest cached scan data."""
-    with data_lock:
-        results = app_state.get_latest_scan_results()
-        response_data = {
-            "fired": results["fired"].to_dict(orient='records')
-        }
-    return jsonify(response_data)
+    """Returns the latest scan snapshot, or 304 when the client already has it."""
+    # Snapshots are immutable and swapped in whole, so reading the reference needs no lock
+    snapshot = app_state.get_latest_snapshot()
+    if request.if_none_match.contains(snapshot.etag):
+        response = Response(status=304)
+    elif snapshot.gzip_body is not None and 'gzip' in request.accept_encodings:
+        response = Response(snapshot.gzip_body, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(snapshot.body, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['X-Snapshot-Version'] = str(snapshot.version)
+    return response
 
 data_lock = threading.Lock()
 
+@app.route('/stream', methods=['GET'])
+def stream():
+    """Pushes a delta of added, updated and removed fired symbols as each sweep lands."""
+    subscription = broadcaster.subscribe()
+    response = Response(stream_with_context(broadcaster.events(subscription)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/schedule', methods=['GET'])
+def get_schedule():
+    """Returns the last scanned bar and next scheduled run for each timeframe."""
+    with data_lock:
+        schedule = scheduler.schedule()
+        next_run = scheduler.next_run()
+        calendar = scheduler.calendar
+        stale = dict(stale_timeframes)
+        projection = dict(projection_stats)
+    next_open = calendar.next_open()
+    return jsonify({
+        "timeframes": schedule,
+        "next_run": next_run.isoformat() if next_run else None,
+        "market_open": calendar.is_open(),
+        "next_open": next_open.isoformat() if next_open else None,
+        "query_cache": query_cache.stats(),
+        "http": session_stats(),
+        "executor": query_executor.stats(),
+        "universe": universe.stats(),
+        "projection": projection,
+        "state_matrix": state_matrix.stats(),
+        "stale": {tf_display_map[tf]: error for tf, error in stale.items()},
+    })
+
+@app.route('/confluence', methods=['GET'])
+def get_confluence():
+    """
+    Symbols whose `signal` (default fired; also in_squeeze, vol_spike, donchian_break,
+    squeeze_breakout) holds on at least `min_count` timeframes, on every timeframe in
+    `include` and none in `exclude` (comma-separated, e.g. include=1H,Daily), most
+    timeframes first. Optional `limit`.
+    """
+    signal = request.args.get('signal', 'fired')
+    include = [tf for tf in request.args.get('include', '').split(',') if tf]
+    exclude = [tf for tf in request.args.get('exclude', '').split(',') if tf]
+    try:
+        min_count = request.args.get('min_count', 1, type=int)
+        limit = request.args.get('limit', None, type=int)
+        started = perf_counter()
+        result = state_matrix.confluence(signal, min_count, include, exclude, limit)
+        elapsed = perf_counter() - started
+    except ValueError as e:
+        return jsonify({"error": str(e), "signals": list(SIGNALS)}), 400
+    return jsonify({
+        "signal": signal,
+        "count": len(result),
+        "symbols": result.to_dict(orient='records'),
+        "query_us": round(elapsed * 1e6, 1),
+    })
+
 @app.route('/get_all_fired_events', methods=['GET'])
 def get_all_fired_events():
-    """Returns all fired squeeze events for the current day."""
+    """
+    Returns retained fired events with the cursor to pass back as `since`.
+    Optional filters: `since` (cursor), `since_ts` (epoch seconds), `symbol`, `timeframe`.
+    """
+    timeframe = request.args.get('timeframe')
+    if timeframe is not None:
+        # Accept display names ('5m', 'Weekly') as well as suffixes ('|5')
+        timeframe = tf_suffix_map.get(timeframe, timeframe)
     with data_lock:
-        response_data = app_state.get_all_fired_events()
-    return jsonify(response_data)
+        selection, cursor = app_state.select_fired_events(
+            since=request.args.get('since', type=int),
+            since_ts=request.args.get('since_ts', type=float),
+            symbol=request.args.get('symbol'),
+            timeframe=timeframe,
+        )
+    # Only the row selection is taken under the lock; building and serializing the dicts is not
+    return jsonify({"events": FiredEventStore.materialize(selection), "cursor": cursor})
 
 @app.route('/update_settings', methods=['POST'])
 def update_settings():
@@ -89,22 +215,84 @@ def update_settings():
 
 if __name__ == "__main__":
     def background_scanner():
-        """Function to run scans in the background."""
+        """Function to run scans in the background, each timeframe just after its bar closes."""
+        from scan import run_intraday_scan, merge_timeframe_results
+
+        # Latest raw frame per timeframe; timeframes not due this sweep keep their last result
+        timeframe_frames = {}
+        calendar_market = scanner_settings['market']
+        was_open = None
         while True:
-            print("Running background scanner...")
             with data_lock:
-                current_settings = scanner_settings.copy()
+                market = scanner_settings['market']
+                if market != calendar_market:
+                    scheduler.calendar = get_calendar(market)
+                    query_cache.calendar = scheduler.calendar
+                    universe.calendar = scheduler.calendar
+                    query_cache.clear()
+                    calendar_market = market
+            due = scheduler.due()
+            if stale_timeframes and not scheduler.calendar.is_open():
+                # A failed session-close sweep is retried at the next open, not all night
+                due = {tf: bar for tf, bar in due.items() if tf not in stale_timeframes}
+            if due:
+                print("Running background scanner for: " + ", ".join(tf or '1D' for tf in due))
+                with data_lock:
+                    current_settings = scanner_settings.copy()
 
-            from scan import run_intraday_scan
+                tickers = universe.tickers(current_settings, cookies) if cookies is not None else None
+                intraday_results = run_intraday_scan(current_settings, cookies, tfs=due, tracker=squeeze_tracker,
+                                                     cache=query_cache, executor=query_executor, tickers=tickers)
+                stale = intraday_results["stale"]
+                if stale:
+                    print("Stale timeframes, keeping their last result: " + ", ".join(tf or '1D' for tf in stale))
+                projection = intraday_results["projection"]
+                print(f"Column projection: {projection['columns']} columns requested, {projection['dropped']} dropped, "
+                      f"~{projection['bytes_saved'] / 1024:.1f} KB saved")
+                timeframe_frames.update(intraday_results["by_timeframe"])
+                # Builds new masks and swaps them in, so /confluence never sees half a sweep
+                state_matrix.update(intraday_results["by_timeframe"], [tf for tf in due if tf not in stale])
+                transitions = intraday_results["transitions"]
+                print("Squeeze transitions: " + ", ".join(f"{len(df)} {name}" for name, df in transitions.items()))
+                latest_results = {"fired": merge_timeframe_results(timeframe_frames), "formed": transitions["formed"]}
+                # Encode once per sweep, before taking the lock
+                snapshot = build_snapshot(latest_results)
 
-            # Run intraday scan
-            intraday_results = run_intraday_scan(current_settings, cookies)
+                with data_lock:
+                    # Failed timeframes stay due and are retried on the next wake-up
+                    scheduler.mark_scanned({tf: bar for tf, bar in due.items() if tf not in stale})
+                    for tf in due:
+                        if tf in stale:
+                            stale_timeframes[tf] = stale[tf]
+                        else:
+                            stale_timeframes.pop(tf, None)
+                    app_state.set_latest_scan_results(latest_results, snapshot)
+                    projection_stats["last"] = projection
+                    projection_stats["bytes_saved"] += projection["bytes_saved"]
+                    # Only this sweep's timeframes produced new events
+                    app_state.add_fired_events(intraday_results["fired"])
 
-            with data_lock:
-                app_state.set_latest_scan_results(intraday_results)
-                app_state.add_fired_events(intraday_results["fired"].to_dict(orient='records'))
+                broadcaster.publish(snapshot)
+                # Written to SQLite by the store's own thread
+                sweep_store.submit(current_settings, intraday_results["by_timeframe"], intraday_results["fired"])
 
-            sleep(300) # Scan every 5 minutes
+            with data_lock:
+                next_run = scheduler.next_run()
+                calendar = scheduler.calendar
+            market_open = calendar.is_open()
+            if market_open != was_open:
+                # The session-close sweep has run; keep serving the cached snapshot until the next open
+                print("Market open." if market_open else f"Market closed. Next session opens at {calendar.next_open()}; idling.")
+                was_open = market_open
+            # Wake at least every 5 minutes to pick up settings changes; waking issues no queries
+            delay = (next_run - calendar.now()).total_seconds() if next_run else 300
+            if stale_timeframes and not market_open:
+                # Stale timeframes keep next_run at now; nothing else closes before the next open
+                next_open = calendar.next_open()
+                delay = (next_open - calendar.now()).total_seconds() if next_open else 300
+            elif stale_timeframes:
+                delay = max(delay, STALE_RETRY_SECONDS, query_executor.retry_in())
+            sleep(min(max(delay, 1), 300))
 
     scanner_thread = threading.Thread(target=background_scanner, daemon=True)
     scanner_thread.start()
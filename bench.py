@@ -0,0 +1,225 @@
+"""
+Benchmarks over synthetic scan data.
+
+    python bench.py evaluator   - local filter evaluation on a 5,000-symbol x 10-timeframe frame
+    python bench.py records     - heatmap payload, column-wise against the old row-wise builder
+    python bench.py compact     - per-session memory of scan results in the compact schema
+
+Nothing here is imported by the app; the fixtures only mimic the shape of screener output.
+"""
+import argparse
+import tracemalloc
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+from tradingview_screener import And, Or
+
+from compact import compact_frame, frame_bytes
+from enrichment import enrich_frame
+from evaluator import SnapshotEvaluator
+from fired_events import FiredEventStore
+from records import OPTIONAL_HEATMAP_FIELDS, heatmap_columns, heatmap_records
+from scan import build_timeframe_filters, merge_timeframe_results, tf_order_map, timeframes
+
+
+def synthetic_snapshot(n_symbols, tfs, seed=7):
+    """Raw signal columns for `tfs`, as a timeframe query returns them, with ~2% missing cells."""
+    rng = np.random.default_rng(seed)
+    data = {'name': [f'SYM{i}' for i in range(n_symbols)]}
+    for tf in tfs:
+        kc = rng.uniform(95, 105, n_symbols)
+        data[f'volume{tf}'] = rng.lognormal(12, 2, n_symbols)
+        data[f'average_volume_10d_calc{tf}'] = rng.lognormal(12, 1.5, n_symbols)
+        for prefix in ('DonchCh20.Upper', 'DonchCh20.Lower'):
+            data[f'{prefix}{tf}'] = rng.uniform(90, 110, n_symbols)
+            data[f'{prefix}[1]{tf}'] = rng.uniform(90, 110, n_symbols)
+        for prefix in ('BB.upper', 'KltChnl.upper', 'BB.lower', 'KltChnl.lower'):
+            data[f'{prefix}{tf}'] = kc + rng.normal(0, 2, n_symbols)
+            data[f'{prefix}[1]{tf}'] = kc + rng.normal(0, 2, n_symbols)
+    df = pd.DataFrame(data)
+    # The screener leaves indicators it cannot compute empty; comparisons must treat them as False
+    holes = rng.random(df.shape) < 0.02
+    holes[:, 0] = False
+    return df.mask(holes)
+
+
+def synthetic_sweep(n_symbols, rng, sweep):
+    """Enriched per-timeframe frames and the merged fired table of one sweep over a pool of 2,000 symbols."""
+    raw = synthetic_snapshot(n_symbols, timeframes)
+    pool = [f'NSE:SYM{i}' for i in rng.integers(0, 2000, n_symbols)]
+    raw['ticker'] = pool
+    raw['name'] = [t[4:] for t in pool]
+    raw['logoid'] = [t[4:].lower() for t in pool]
+    raw['MACD.hist'] = rng.normal(0, 1, n_symbols)
+    ranked = sorted(timeframes, key=tf_order_map.get, reverse=True)
+    frames = {}
+    for tf in timeframes:
+        rows = raw.sample(frac=0.3, random_state=sweep + len(frames)).assign(timeframe=tf)
+        frames[tf] = enrich_frame(rows.reset_index(drop=True), tf, ranked)
+    return frames, merge_timeframe_results(frames)
+
+
+def synthetic_scan(n_symbols, seed=7):
+    """A fired table with the heatmap fields, ~5% missing in the nullable ones."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'ticker': [f'NSE:SYM{i}' for i in range(n_symbols)],
+        'HeatmapScore': rng.normal(0, 2, n_symbols),
+        'SqueezeCount': rng.integers(1, 6, n_symbols),
+        'rvol': rng.lognormal(0.5, 0.5, n_symbols),
+        'URL': [f'https://in.tradingview.com/chart/?symbol=NSE%3ASYM{i}' for i in range(n_symbols)],
+        'logo': [f'https://s3-symbol-logo.tradingview.com/sym{i}.svg' for i in range(n_symbols)],
+        'momentum': rng.choice(['Bullish', 'Bearish', 'Neutral'], n_symbols),
+        'highest_tf': rng.choice(['5m', '15m', '1H', 'Weekly'], n_symbols),
+        'squeeze_strength': rng.choice(['STRONG', 'VERY STRONG'], n_symbols),
+        'previous_volatility': rng.random(n_symbols),
+        'current_volatility': rng.random(n_symbols),
+        'fired_timestamp': pd.Timestamp('2026-10-16 10:15', tz='UTC') + pd.to_timedelta(rng.integers(0, 3600, n_symbols), unit='s'),
+    })
+    # Scores, RVOL and momentum are missing for symbols the screener could not compute
+    for column in ('HeatmapScore', 'rvol', 'momentum', 'previous_volatility'):
+        df.loc[rng.random(n_symbols) < 0.05, column] = np.nan
+    return df
+
+
+def heatmap_records_iterrows(df):
+    """The row-by-row heatmap builder records.py replaced, as the baseline to compare against."""
+    df = df.copy()
+    for c in ['ticker', 'HeatmapScore', 'SqueezeCount', 'rvol', 'URL', 'logo', 'momentum', 'highest_tf', 'squeeze_strength']:
+        if c not in df.columns:
+            df[c] = 'N/A' if c in ['momentum', 'highest_tf', 'squeeze_strength'] else 0
+    heatmap_data = []
+    for _, row in df.iterrows():
+        stock_data = {
+            "name": row['ticker'],
+            "value": row['HeatmapScore'] if pd.notna(row['HeatmapScore']) else None,
+            "count": row.get('SqueezeCount', 0) if pd.notna(row.get('SqueezeCount', 0)) else 0,
+            "rvol": row['rvol'] if pd.notna(row['rvol']) else None,
+            "url": row['URL'],
+            "logo": row['logo'],
+            "momentum": row['momentum'] if pd.notna(row['momentum']) else None,
+            "highest_tf": row['highest_tf'] if pd.notna(row['highest_tf']) else None,
+            "squeeze_strength": row['squeeze_strength'] if pd.notna(row['squeeze_strength']) else None
+        }
+        for col_name in OPTIONAL_HEATMAP_FIELDS:
+            if col_name in df.columns:
+                stock_data[col_name] = row[col_name] if pd.notna(row[col_name]) else None
+        if 'fired_timestamp' in df.columns and pd.notna(row['fired_timestamp']):
+            stock_data['fired_timestamp'] = row['fired_timestamp'].isoformat()
+        heatmap_data.append(stock_data)
+    return heatmap_data
+
+
+def bench_evaluator(n_symbols=5000, repeat=20):
+    tfs = list(tf_order_map)
+    df = synthetic_snapshot(n_symbols, tfs)
+    expressions = {}
+    for tf in tfs:
+        signals = build_timeframe_filters(tf)
+        expressions[tf] = And(signals['vol_spike'], Or(signals['donchian_break'], signals['squeeze_breakout']))
+
+    start = perf_counter()
+    for _ in range(repeat):
+        evaluator = SnapshotEvaluator(df)
+        counts = {tf: int(evaluator.evaluate(expr).sum()) for tf, expr in expressions.items()}
+    cold = (perf_counter() - start) / repeat
+
+    evaluator = SnapshotEvaluator(df)
+    for expr in expressions.values():
+        evaluator.evaluate(expr)
+    start = perf_counter()
+    for _ in range(repeat):
+        for expr in expressions.values():
+            evaluator.evaluate(expr)
+    warm = (perf_counter() - start) / repeat
+
+    print(f"Snapshot: {n_symbols} symbols x {len(tfs)} timeframes ({df.shape[1]} columns)")
+    print(f"Cold pass (column conversion + {len(tfs)} signal blocks): {cold * 1000:.2f} ms")
+    print(f"Warm pass (cached columns, {len(tfs)} signal blocks): {warm * 1000:.2f} ms")
+    print("Fired per timeframe: " + ", ".join(f"{tf or '1D'}={count}" for tf, count in counts.items()))
+
+
+def bench_records(n_symbols=500, repeat=20):
+    df = synthetic_scan(n_symbols)
+    timings = {}
+    for label, build in (('iterrows', heatmap_records_iterrows), ('records', heatmap_records), ('columns', heatmap_columns)):
+        start = perf_counter()
+        for _ in range(repeat):
+            build(df)
+        timings[label] = (perf_counter() - start) / repeat
+
+    # NaN fields must come out as None either way; the row-wise version keeps numpy scalars
+    legacy = [{k: (None if isinstance(v, float) and np.isnan(v) else v) for k, v in r.items()} for r in heatmap_records_iterrows(df)]
+    assert legacy == heatmap_records(df), "vectorized records differ from the row-wise builder"
+
+    print(f"Heatmap payload for {n_symbols} symbols ({df.shape[1]} columns)")
+    for label, seconds in timings.items():
+        print(f"{label:>9}: {seconds * 1000:8.2f} ms ({timings['iterrows'] / seconds:6.1f}x)")
+
+
+def bench_compact(sweeps=75, n_symbols=300, seed=3):
+    """
+    Per-session footprint of what app.py keeps: the latest frame per timeframe, the fired
+    table, and every sweep's fired events (one session of 5m sweeps by default).
+    """
+    rng = np.random.default_rng(seed)
+    session = [synthetic_sweep(n_symbols, rng, sweep) for sweep in range(sweeps)]
+    frames, fired = session[-1]
+
+    held_before = sum(frame_bytes(f) for f in frames.values()) + frame_bytes(fired)
+    held_after = sum(frame_bytes(compact_frame(f)) for f in frames.values()) + frame_bytes(compact_frame(fired))
+
+    def measure(add):
+        tracemalloc.start()
+        store = add()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return store, size
+
+    def as_dicts():
+        # What the store held before: every event as a dict of Python objects
+        events = []
+        for _, fired in session:
+            events.extend(fired.to_dict(orient='records'))
+        return events
+
+    def as_frames():
+        store = FiredEventStore(max_events=None, retention_seconds=None)
+        for _, fired in session:
+            store.add(fired)
+        return store
+
+    dicts, events_before = measure(as_dicts)
+    store, events_after = measure(as_frames)
+    n_events = len(dicts)
+    sample, _ = store.query(since=n_events - 5)
+    assert [e['name'] for e in sample] == [e['name'] for e in dicts[-5:]], "store returned different events"
+
+    mb = 1024 * 1024
+    print(f"Session of {sweeps} sweeps, {n_symbols} symbols per sweep, {n_events} fired events")
+    print(f"{'':>22}{'before':>12}{'after':>12}")
+    print(f"{'latest frames':>22}{held_before / mb:10.2f}MB{held_after / mb:10.2f}MB  ({held_before / held_after:4.1f}x)")
+    print(f"{'fired-event history':>22}{events_before / mb:10.2f}MB{events_after / mb:10.2f}MB  ({events_before / events_after:4.1f}x)")
+
+
+BENCHMARKS = {
+    'evaluator': bench_evaluator,
+    'records': bench_records,
+    'compact': bench_compact,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run benchmarks over synthetic scan data.')
+    parser.add_argument('names', nargs='*', metavar='NAME', help=f"benchmarks to run ({', '.join(BENCHMARKS)}; default all)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Compact in-memory schema for scan results.
+
+Screener frames arrive as float64 indicators and object strings. `compact_frame` keeps
+what a session holds on to (per-timeframe frames, the fired table, the fired-event
+history) as:
+
+    - float32 indicators and the smallest integer type that fits the counts; volumes,
+      traded value and counts stay float64, since float32 holds integers exactly only up
+      to 2**24 and weekly and monthly volumes routinely pass it;
+    - categoricals for labels: fixed categories for momentum, direction and strength,
+      per-frame categories for timeframes, and per-frame categories over interned strings
+      for ticker/name/logoid, so a symbol repeated across sweeps is one string;
+    - one sweep timestamp instead of a `fired_timestamp` value per row, where the caller
+      keeps it (see `fired_events.FiredEventStore`).
+
+Encoders widen float32 back with `expand_frame`, which takes the shortest decimal that
+round-trips the float32 value, so JSON and stored payloads read `101.25`, not
+`101.25000762939453`.
+
+Run `python bench.py compact` for the per-session memory benchmark.
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+LABEL_DTYPES = {
+    'timeframe': 'category',
+    'highest_tf': 'category',
+    'highest_squeeze_tf': 'category',
+    'fired_timeframe': 'category',
+    'momentum': pd.CategoricalDtype(['Bullish', 'Bearish', 'Neutral']),
+    'breakout_direction': pd.CategoricalDtype(['Bullish', 'Bearish', 'Neutral']),
+    'squeeze_strength': pd.CategoricalDtype(['VERY STRONG', 'STRONG', 'Regular', 'N/A']),
+}
+SYMBOL_COLUMNS = ('ticker', 'name', 'logoid')
+# Integer-valued floats that must survive exactly (the vol_spike and replay thresholds read them)
+FULL_PRECISION_PREFIXES = ('volume', 'average_volume', 'Value.Traded', 'count', 'squeeze_count', 'SqueezeCount')
+
+
+def _symbol_category(series):
+    values = series.astype(object)
+    categories = pd.unique(values[values.notna()])
+    interned = [sys.intern(v) if isinstance(v, str) else v for v in categories]
+    return pd.Categorical(values, categories=interned)
+
+
+def compact_frame(df, drop=()):
+    """A compact copy of `df` (see the module docstring); `drop` names columns to leave out."""
+    if df is None:
+        return None
+    columns = {}
+    for name in df.columns:
+        if name in drop:
+            continue
+        series = df[name]
+        dtype = series.dtype
+        if name in LABEL_DTYPES and not isinstance(dtype, pd.CategoricalDtype):
+            series = series.astype(LABEL_DTYPES[name])
+        elif name in SYMBOL_COLUMNS and not isinstance(dtype, pd.CategoricalDtype):
+            series = pd.Series(_symbol_category(series), index=series.index)
+        elif pd.api.types.is_float_dtype(dtype) and dtype != np.float32 and not name.startswith(FULL_PRECISION_PREFIXES):
+            series = series.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            series = pd.to_numeric(series, downcast='integer')
+        columns[name] = series
+    return pd.DataFrame(columns, index=df.index)
+
+
+def expand_frame(df):
+    """
+    `df` with float32 columns widened to float64 via their shortest round-tripping decimal
+    and categoricals back to plain values; frames without either are returned as is.
+    """
+    if df is None:
+        return None
+    widen = [c for c, dtype in df.dtypes.items() if dtype == np.float32 or isinstance(dtype, pd.CategoricalDtype)]
+    if not widen:
+        return df
+    df = df.copy()
+    for name in widen:
+        series = df[name]
+        if series.dtype == np.float32:
+            df[name] = series.astype(str).astype(np.float64)
+        else:
+            df[name] = series.astype(object).where(series.notna(), np.nan)
+    return df
+
+
+def frame_bytes(df):
+    return 0 if df is None else int(df.memory_usage(deep=True).sum())
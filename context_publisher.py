@@ -0,0 +1,115 @@
+"""
+Publishes the per-instrument squeeze context consumed by the live WSS client.
+
+Each sweep's in-squeeze and fired tables are turned into one document per instrument
+key (`NSE_EQ|INE...`). Fields are built column by column via `records.heatmap_columns`,
+the symbol -> instrument-key mapping is loaded once and cached (or resolved through an
+`instrument_map.InstrumentMap`), and only documents that differ from what was last
+written are sent in the `bulk_write`.
+"""
+from time import monotonic
+
+import pandas as pd
+
+from records import heatmap_columns
+
+# How long a loaded instrument mapping is trusted before it is rebuilt
+MAPPING_MAX_AGE_SECONDS = 6 * 60 * 60
+
+
+class ContextPublisher:
+    """
+    Symbols are resolved through `instruments` (an `InstrumentMap`, which reloads itself
+    when the master file changes) or, without one, through `mapping_loader`: a callable
+    returning the symbol -> instrument-key dict (e.g. the `name_to_instrument` part of
+    `create_bidirectional_mapping()`), called again only when the cached mapping is older
+    than `mapping_max_age` or `refresh_mapping()` was called.
+    """
+
+    def __init__(self, collection, mapping_loader=None, mapping_max_age=MAPPING_MAX_AGE_SECONDS, instruments=None):
+        if instruments is None and mapping_loader is None:
+            raise ValueError("ContextPublisher needs an InstrumentMap or a mapping loader")
+        self.collection = collection
+        self.mapping_loader = mapping_loader
+        self.mapping_max_age = mapping_max_age
+        self.instruments = instruments
+        self._instruments_version = None
+        self._mapping = None
+        self._mapping_loaded_at = None
+        # instrument key -> document as last written
+        self._published = {}
+
+    def refresh_mapping(self):
+        self._mapping = None
+
+    def instrument_map(self):
+        stale = self._mapping_loaded_at is None or monotonic() - self._mapping_loaded_at > self.mapping_max_age
+        if self._mapping is None or stale:
+            mapping = self.mapping_loader()
+            if mapping != self._mapping:
+                # Keys may now resolve differently; let every document be re-sent once
+                self._published.clear()
+            self._mapping = mapping
+            self._mapping_loaded_at = monotonic()
+        return self._mapping
+
+    def map_symbols(self, tickers):
+        """Instrument key per ticker ('NSE:X'), NaN where the symbol is unknown."""
+        if self.instruments is None:
+            return tickers.astype(str).str.split(':').str[-1].map(self.instrument_map())
+        keys = self.instruments.map_symbols(tickers)
+        if self.instruments.version != self._instruments_version:
+            self._published.clear()
+            self._instruments_version = self.instruments.version
+        return keys
+
+    def build_documents(self, dfs_dict):
+        """Returns {instrument key: context document} for the sweep's in-squeeze and fired tables."""
+        in_squeeze = dfs_dict.get('in_squeeze')
+        fired = dfs_dict.get('fired')
+        frames = []
+        if in_squeeze is not None and not in_squeeze.empty:
+            frames.append(in_squeeze.assign(is_in_squeeze=True))
+        if fired is not None and not fired.empty:
+            # A symbol still in a squeeze on another timeframe is reported as in squeeze
+            if frames:
+                fired = fired[~fired['ticker'].isin(in_squeeze['ticker'])]
+            frames.append(fired.assign(is_in_squeeze=False))
+        if not frames:
+            return {}
+        final_df = pd.concat(frames, ignore_index=True)
+
+        symbols = final_df['ticker'].astype(str).str.split(':').str[-1]
+        instruments = self.map_symbols(final_df['ticker'])
+        mapped = instruments.notna().to_numpy()
+        if not mapped.all():
+            missing = symbols[~mapped]
+            print(f"Skipping {len(missing)} symbols without an instrument key: {', '.join(missing.head(10))}"
+                  + (' ...' if len(missing) > 10 else ''))
+
+        columns = heatmap_columns(final_df[mapped])
+        columns['ticker'] = instruments[mapped].tolist()
+        columns['tradingname'] = symbols[mapped].tolist()
+        columns['is_in_squeeze'] = final_df.loc[mapped, 'is_in_squeeze'].astype(bool).tolist()
+
+        fields = list(columns)
+        documents = {}
+        for values in zip(*columns.values()):
+            doc = dict(zip(fields, values))
+            # In-squeeze rows come first, so they win over a fired row for the same instrument
+            documents.setdefault(doc['ticker'], doc)
+        return documents
+
+    def publish(self, dfs_dict):
+        """Upserts the documents that changed since the last sweep; returns how many were sent."""
+        from pymongo import ReplaceOne
+
+        documents = self.build_documents(dfs_dict)
+        changed = {key: doc for key, doc in documents.items() if self._published.get(key) != doc}
+        if not changed:
+            return 0
+        operations = [ReplaceOne({'ticker': key}, doc, upsert=True) for key, doc in changed.items()]
+        self.collection.bulk_write(operations, ordered=False)
+        # Only record what was written, so a failed write is retried on the next sweep
+        self._published.update(changed)
+        return len(changed)
@@ -0,0 +1,125 @@
+"""
+Vectorized per-symbol enrichment of scan frames.
+
+Screener rows carry indicator columns suffixed per timeframe (`BB.upper|15`, ...). Every
+derived field is computed for all rows of a timeframe at once with array operations and
+`np.select`, replacing the row-wise helpers (`get_squeeze_strength`, `get_dynamic_rvol`,
+`get_fired_breakout_direction_for_fired`, `get_highest_squeeze_tf`) and `apply` lambdas.
+Missing or zero inputs give the same neutral values the row-wise helpers returned.
+"""
+import numpy as np
+import pandas as pd
+
+STRONG_SQUEEZES = ('STRONG', 'VERY STRONG')
+
+
+def numeric_column(df, column):
+    """A column as a float array, NaN where missing or non-numeric (all NaN if the column is absent)."""
+    if column not in df:
+        return np.full(len(df), np.nan)
+    series = df[column]
+    if pd.api.types.is_float_dtype(series.dtype):
+        return series.to_numpy(dtype=float, na_value=np.nan)
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+
+def squeeze_state(df, tf):
+    """Vectorized (in_squeeze, observed, volatility) arrays for timeframe suffix `tf`."""
+    bb_upper, bb_lower = numeric_column(df, f'BB.upper{tf}'), numeric_column(df, f'BB.lower{tf}')
+    kc_upper, kc_lower = numeric_column(df, f'KltChnl.upper{tf}'), numeric_column(df, f'KltChnl.lower{tf}')
+    observed = ~(np.isnan(bb_upper) | np.isnan(bb_lower) | np.isnan(kc_upper) | np.isnan(kc_lower))
+    with np.errstate(invalid='ignore'):
+        in_squeeze = observed & (bb_upper < kc_upper) & (bb_lower > kc_lower)
+    # Band width (BB.upper - SMA20) relative to ATR, 0 when it cannot be computed
+    atr, sma20 = numeric_column(df, f'ATR{tf}'), numeric_column(df, f'SMA20{tf}')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        volatility = (bb_upper - sma20) / atr
+    volatility[~np.isfinite(volatility)] = 0.0
+    return in_squeeze, observed, volatility
+
+
+def momentum(df):
+    """'Bullish' / 'Bearish' / 'Neutral' from the sign of MACD.hist."""
+    hist = numeric_column(df, 'MACD.hist')
+    with np.errstate(invalid='ignore'):
+        return np.select([hist > 0, hist < 0], ['Bullish', 'Bearish'], 'Neutral').astype(object)
+
+
+def relative_volume(df, tf):
+    """volume / 10-day average volume on `tf`, 0 when either is missing or the average is 0."""
+    volume, average = numeric_column(df, f'volume{tf}'), numeric_column(df, f'average_volume_10d_calc{tf}')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rvol = volume / average
+    rvol[~np.isfinite(rvol)] = 0.0
+    return rvol
+
+
+def squeeze_strength(df, tf):
+    """Keltner width over Bollinger width on `tf`, bucketed: >=2 VERY STRONG, >=1.5 STRONG, >1 Regular."""
+    bb_width = numeric_column(df, f'BB.upper{tf}') - numeric_column(df, f'BB.lower{tf}')
+    kc_width = numeric_column(df, f'KltChnl.upper{tf}') - numeric_column(df, f'KltChnl.lower{tf}')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(bb_width != 0, kc_width / bb_width, np.nan)
+        return np.select([ratio >= 2, ratio >= 1.5, ratio > 1], ['VERY STRONG', 'STRONG', 'Regular'], 'N/A').astype(object)
+
+
+def breakout_direction(df, tf):
+    """
+    'Bullish' when close > BB.upper > KC.upper, 'Bearish' when close < BB.lower < KC.lower,
+    else 'Neutral'. With tf='' this reads the un-suffixed columns of a fired-event frame.
+    """
+    close = numeric_column(df, 'close')
+    bb_upper, bb_lower = numeric_column(df, f'BB.upper{tf}'), numeric_column(df, f'BB.lower{tf}')
+    kc_upper, kc_lower = numeric_column(df, f'KltChnl.upper{tf}'), numeric_column(df, f'KltChnl.lower{tf}')
+    with np.errstate(invalid='ignore'):
+        bullish = (close > bb_upper) & (bb_upper > kc_upper)
+        bearish = (close < bb_lower) & (bb_lower < kc_lower)
+    return np.select([bullish, bearish], ['Bullish', 'Bearish'], 'Neutral').astype(object)
+
+
+def highest_timeframe(masks, default=None):
+    """
+    Per row, the first timeframe in `masks` (an ordered {tf: bool array}, highest rank
+    first) whose mask is True, else `default`.
+    """
+    tfs = list(masks)
+    if not tfs:
+        return np.array([], dtype=object)
+    stacked = np.column_stack([np.asarray(masks[tf], dtype=bool) for tf in tfs])
+    first = stacked.argmax(axis=1)
+    return np.where(stacked.any(axis=1), np.asarray(tfs, dtype=object)[first], default)
+
+
+def select_by_timeframe(df, row_tfs, compute, tfs, default=0.0):
+    """Per row, `compute(df, tf)` evaluated on that row's own timeframe in `row_tfs`."""
+    row_tfs = np.asarray(row_tfs, dtype=object)
+    present = [tf for tf in tfs if (row_tfs == tf).any()]
+    if not present:
+        return np.full(len(df), default, dtype=object if isinstance(default, str) else float)
+    return np.select([row_tfs == tf for tf in present], [compute(df, tf) for tf in present], default)
+
+
+def enrich_frame(df, tf, ranked_tfs, previous_volatility=None):
+    """
+    Adds the derived columns for a frame of symbols that fired on `tf`:
+
+        momentum, rvol, breakout_direction, current_volatility, previous_volatility
+            - on the firing timeframe `tf`
+        squeeze_count, highest_squeeze_tf, squeeze_strength
+            - across `ranked_tfs` (highest rank first); strength is taken on the
+              highest timeframe still in a squeeze
+    """
+    _, _, current = squeeze_state(df, tf)
+    in_squeeze = {t: squeeze_state(df, t)[0] for t in ranked_tfs}
+    squeeze_tf = highest_timeframe(in_squeeze)
+    previous = np.zeros(len(df)) if previous_volatility is None else np.asarray(previous_volatility, dtype=float)
+    return df.assign(
+        momentum=momentum(df),
+        rvol=relative_volume(df, tf),
+        breakout_direction=breakout_direction(df, tf),
+        current_volatility=current,
+        previous_volatility=previous,
+        squeeze_count=np.sum(list(in_squeeze.values()), axis=0) if in_squeeze else 0,
+        highest_squeeze_tf=squeeze_tf,
+        squeeze_strength=select_by_timeframe(df, squeeze_tf, squeeze_strength, ranked_tfs, 'N/A'),
+    )
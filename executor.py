@@ -0,0 +1,212 @@
+"""
+Resilient execution of screener queries.
+
+`QueryExecutor` sits in front of `http_session.get_scanner_data`:
+
+    - a token bucket caps the request rate across every scan thread, so raising the
+      concurrency cannot burst past what the screener tolerates;
+    - throttling (429), server errors and connection failures are retried with full-jitter
+      exponential backoff, honouring `Retry-After` when the screener sends one;
+    - a circuit breaker per endpoint stops sending once failures pile up and lets a single
+      probe through after a cool-down, so an outage costs one request per cool-down instead
+      of a retry storm from every timeframe.
+
+Errors that retrying cannot fix (other 4xx, malformed payloads) are raised at once and do
+not count against the breaker.
+"""
+import random
+import threading
+from time import monotonic, sleep
+
+import requests
+
+import http_session
+
+DEFAULT_RATE = 2.0
+DEFAULT_BURST = 5
+MAX_ATTEMPTS = 3
+BASE_DELAY_SECONDS = 1.0
+MAX_DELAY_SECONDS = 10.0
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT_SECONDS = 60.0
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a query while its endpoint's breaker is open."""
+
+
+class TokenBucket:
+    """Thread-safe requests-per-second limiter; `acquire` blocks until a token is free."""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token, sleeping until it is available; returns the seconds waited."""
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the token now and wait out the debt outside the lock
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if delay:
+            sleep(delay)
+        return delay
+
+
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` consecutive failures -> half-open after `reset_timeout`."""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def retry_in(self):
+        """Seconds until an open breaker lets a probe through (0 when closed or half-open)."""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (monotonic() - self.opened_at))
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = monotonic()
+            self._probing = False
+
+
+def _retry_after(error):
+    """Seconds requested by a Retry-After header, if the error carries one."""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def is_retryable(error):
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(error, 'response', None)
+    return isinstance(error, requests.HTTPError) and response is not None and response.status_code in RETRY_STATUS
+
+
+class QueryExecutor:
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_attempts=MAX_ATTEMPTS,
+                 base_delay=BASE_DELAY_SECONDS, max_delay=MAX_DELAY_SECONDS,
+                 failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT_SECONDS, fetch=None):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.fetch = fetch or http_session.get_scanner_data
+        self.breakers = {}
+        self.requests = 0
+        self.retries = 0
+        self.rejected = 0
+        self.throttled_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def breaker(self, endpoint):
+        with self._lock:
+            breaker = self.breakers.get(endpoint)
+            if breaker is None:
+                breaker = self.breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def backoff(self, attempt):
+        """Full jitter: uniform over [0, min(max_delay, base_delay * 2**attempt)]."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def worst_case(self, timeout):
+        """Upper bound on the seconds one query can take, retries and backoff included."""
+        backoff = sum(min(self.max_delay, self.base_delay * 2 ** attempt) for attempt in range(self.max_attempts - 1))
+        return self.max_attempts * timeout + backoff
+
+    def retry_in(self):
+        """Seconds until every open breaker allows a probe again."""
+        with self._lock:
+            breakers = list(self.breakers.values())
+        return max((b.retry_in() for b in breakers), default=0.0)
+
+    def get_scanner_data(self, query, **kwargs):
+        """`http_session.get_scanner_data(query, **kwargs)` under the rate limit, retries and breaker."""
+        breaker = self.breaker(query.url)
+        for attempt in range(self.max_attempts):
+            if not breaker.allow():
+                with self._lock:
+                    self.rejected += 1
+                raise CircuitOpenError(f"{query.url} is failing; next attempt in {breaker.retry_in():.0f}s")
+            waited = self.bucket.acquire()
+            with self._lock:
+                self.requests += 1
+                self.throttled_seconds += waited
+            try:
+                result = self.fetch(query, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    # The query itself is at fault; the endpoint is healthy
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                # Once the breaker trips, report the failure itself rather than retrying into it
+                if attempt == self.max_attempts - 1 or breaker.state != 'closed':
+                    raise
+                delay = _retry_after(e)
+                delay = min(self.max_delay, delay) if delay is not None else self.backoff(attempt)
+                print(f"Scanner request failed ({e.__class__.__name__}); retry {attempt + 1} in {delay:.1f}s")
+                with self._lock:
+                    self.retries += 1
+                sleep(delay)
+                continue
+            breaker.record_success()
+            return result
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'requests': self.requests,
+                'retries': self.retries,
+                'rejected': self.rejected,
+                'throttled_seconds': round(self.throttled_seconds, 3),
+            }
+            breakers = dict(self.breakers)
+        stats['breakers'] = {endpoint: b.state for endpoint, b in breakers.items()}
+        return stats
@@ -0,0 +1,178 @@
+"""
+Bounded, indexed store for fired scan events.
+
+Every event gets a monotonically increasing sequence number. Clients keep the last
+sequence number they saw as a cursor and ask only for what came after it. Events older
+than the retention window, or beyond the cap, are dropped from the left.
+
+Each sweep's events are kept as one compact frame (`compact.compact_frame`) with a single
+fired timestamp, and turned into dicts only for the events a query returns.
+
+The store does no locking of its own; callers guard it with their state lock. `select`
+is the part that needs it; `materialize` only reads frames that are never modified, so
+building the dicts can happen after the lock is released.
+"""
+from bisect import bisect_right
+from collections import defaultdict, deque
+from time import time
+
+import pandas as pd
+
+from compact import compact_frame, expand_frame
+
+
+class FiredEventStore:
+    def __init__(self, max_events=50000, retention_seconds=24 * 60 * 60):
+        self.max_events = max_events
+        self.retention_seconds = retention_seconds
+        self._first_seq = 1
+        self._next_seq = 1
+        # (first seq, added-at epoch seconds, compact frame, fired timestamp or None), one per add()
+        self._batches = deque()
+        self._by_symbol = defaultdict(deque)   # symbol -> seqs, ascending
+        self._by_timeframe = defaultdict(deque)
+
+    def __len__(self):
+        return self._next_seq - self._first_seq
+
+    @property
+    def cursor(self):
+        """Sequence number of the newest event, or 0 when nothing was ever added."""
+        return self._next_seq - 1
+
+    @staticmethod
+    def symbol_key(symbol):
+        """Index key for a symbol, so 'NSE:AXISBANK' and 'AXISBANK' resolve alike."""
+        return str(symbol).split(':')[-1]
+
+    def add(self, events, timestamp=None):
+        """
+        Appends one sweep's events (the fired DataFrame, or dicts) with 'name' and
+        'highest_tf' columns, and returns the new cursor.
+        """
+        timestamp = time() if timestamp is None else timestamp
+        frame = events if isinstance(events, pd.DataFrame) else pd.DataFrame(list(events))
+        if not frame.empty:
+            first = self._next_seq
+            self._next_seq += len(frame)
+            fired_at = None
+            # A sweep's events share one fired timestamp; keep it once instead of per row
+            if 'fired_timestamp' in frame and frame['fired_timestamp'].nunique(dropna=False) == 1:
+                fired_at = frame['fired_timestamp'].iloc[0]
+            drop = ('fired_timestamp',) if fired_at is not None else ()
+            self._batches.append((first, timestamp, compact_frame(frame.reset_index(drop=True), drop), fired_at))
+            for column, index, key in (('name', self._by_symbol, self.symbol_key), ('highest_tf', self._by_timeframe, None)):
+                if column not in frame:
+                    continue
+                for seq, value in zip(range(first, self._next_seq), frame[column].tolist()):
+                    if value is not None and value == value:
+                        index[key(value) if key else value].append(seq)
+        self.prune(timestamp)
+        return self.cursor
+
+    def prune(self, now=None):
+        """Drops events outside the retention window and beyond the cap."""
+        now = time() if now is None else now
+        keep_from = self._first_seq
+        if self.retention_seconds is not None:
+            cutoff = now - self.retention_seconds
+            while self._batches and self._batches[0][1] < cutoff:
+                self._batches.popleft()
+            keep_from = self._batches[0][0] if self._batches else self._next_seq
+        if self.max_events is not None:
+            keep_from = max(keep_from, self._next_seq - self.max_events)
+        if keep_from <= self._first_seq:
+            return
+
+        self._first_seq = keep_from
+        while self._batches and len(self._batches) > 1 and self._batches[1][0] <= keep_from:
+            self._batches.popleft()
+        for index in (self._by_symbol, self._by_timeframe):
+            for key in list(index):
+                seqs = index[key]
+                while seqs and seqs[0] < keep_from:
+                    seqs.popleft()
+                if not seqs:
+                    del index[key]
+
+    def _seq_after_timestamp(self, since_ts):
+        """First sequence number added strictly after `since_ts` (epoch seconds)."""
+        first = self._next_seq
+        for batch_seq, added_at, _, _ in reversed(self._batches):
+            if added_at <= since_ts:
+                break
+            first = batch_seq
+        return first
+
+    def query(self, since=None, since_ts=None, symbol=None, timeframe=None):
+        """
+        Returns `(events, cursor)` for events newer than the `since` cursor and/or the
+        `since_ts` epoch timestamp, optionally restricted to one symbol or timeframe.
+        Pass the returned cursor back as `since` to receive only newer events next time.
+        """
+        selection, cursor = self.select(since=since, since_ts=since_ts, symbol=symbol, timeframe=timeframe)
+        return self.materialize(selection), cursor
+
+    def select(self, since=None, since_ts=None, symbol=None, timeframe=None):
+        """
+        Like `query`, but returns `(selection, cursor)` where the selection only points at
+        the matching rows. Batch frames are never modified once added, so callers can take
+        the selection under their lock and `materialize` it after releasing it.
+        """
+        start = self._first_seq
+        if since is not None:
+            start = max(start, since + 1)
+        if since_ts is not None:
+            start = max(start, self._seq_after_timestamp(since_ts))
+
+        candidates = None
+        for index, key in ((self._by_symbol, symbol and self.symbol_key(symbol)), (self._by_timeframe, timeframe)):
+            if key is None:
+                continue
+            seqs = self._tail(index.get(key, ()), start)
+            candidates = seqs if candidates is None else sorted(set(candidates).intersection(seqs))
+
+        if candidates is None:
+            candidates = range(start, self._next_seq)
+        return self._slices(candidates), self.cursor
+
+    def _slices(self, seqs):
+        """(compact frame, row positions, fired timestamp) per batch for ascending, retained sequence numbers."""
+        firsts = [batch[0] for batch in self._batches]
+        slices = []
+        i, seqs = 0, list(seqs)
+        while i < len(seqs):
+            b = bisect_right(firsts, seqs[i]) - 1
+            first, _, frame, fired_at = self._batches[b]
+            end = firsts[b + 1] if b + 1 < len(firsts) else self._next_seq
+            j = i
+            while j < len(seqs) and seqs[j] < end:
+                j += 1
+            slices.append((frame, [seq - first for seq in seqs[i:j]], fired_at))
+            i = j
+        return slices
+
+    @staticmethod
+    def materialize(selection):
+        """Event dicts for a selection returned by `select`."""
+        events = []
+        for frame, positions, fired_at in selection:
+            rows = expand_frame(frame.iloc[positions])
+            # Missing indicators as None, so the events serialize as valid JSON (null, not NaN)
+            records = rows.astype(object).where(rows.notna(), None).to_dict(orient='records')
+            if fired_at is not None:
+                for record in records:
+                    record['fired_timestamp'] = fired_at
+            events.extend(records)
+        return events
+
+    @staticmethod
+    def _tail(seqs, start):
+        """Index entries >= start, walking back from the newest end."""
+        tail = []
+        for seq in reversed(seqs):
+            if seq < start:
+                break
+            tail.append(seq)
+        tail.reverse()
+        return tail
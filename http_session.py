@@ -0,0 +1,123 @@
+"""
+Pooled keep-alive HTTP sessions for screener queries.
+
+`Query.get_scanner_data` posts through a bare `requests.post`, which builds a new
+connection pool for every call, so each timeframe of each sweep pays TCP and TLS setup
+again. Here one `requests.Session` is kept per cookie jar: the jar is attached once, the
+library's headers (plus gzip/deflate acceptance) are set once, and its connection pool is
+sized for the concurrent scan workers. `get_scanner_data` is a drop-in for the library
+method and parses the response the same way, so callers get the same `(count, df)`.
+"""
+import threading
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from tradingview_screener.query import DEFAULT_RANGE, HEADERS
+
+# Enough keep-alive connections for the concurrent scan mode and the BKP scanners together
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 20
+
+
+def scanner_frame(query, json_obj):
+    """(total count, DataFrame) from a scanner response, as `Query.get_scanner_data` builds it."""
+    rows_count = json_obj['totalCount']
+    if '/scan2' in query.url:
+        columns = ['ticker', *json_obj['fields']]
+        rows = json_obj.get('symbols')
+        if rows:
+            return rows_count, pd.DataFrame(([row['s'], *row['f']] for row in rows), columns=columns)
+        return rows_count, pd.DataFrame([], columns=columns)
+    columns = ['ticker', *query.query.get('columns', ())]
+    return rows_count, pd.DataFrame(([row['s'], *row['d']] for row in json_obj['data']), columns=columns)
+
+
+class ScannerSession:
+    """
+    A thread-safe pooled session. urllib3's pool hands each thread its own connection and
+    takes it back for reuse afterwards; the shared cookie jar guards itself with a lock.
+    """
+
+    def __init__(self, cookies=None, pool_size=DEFAULT_POOL_SIZE):
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        self.session.headers['accept-encoding'] = 'gzip, deflate'
+        self.session.headers['connection'] = 'keep-alive'
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if cookies is not None:
+            self.session.cookies.update(cookies)
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def get_scanner_data_raw(self, query, timeout=DEFAULT_TIMEOUT):
+        query.query.setdefault('range', DEFAULT_RANGE.copy())
+        try:
+            r = self.session.post(query.url, json=query.query, timeout=timeout)
+            if not r.ok:
+                # Same error text as the library, body included for debugging
+                r.reason += f'\n Body: {r.text}\n'
+                r.raise_for_status()
+            json_obj = r.json()
+        except Exception:
+            with self._lock:
+                self.requests += 1
+                self.failures += 1
+            raise
+        with self._lock:
+            self.requests += 1
+        return json_obj
+
+    def get_scanner_data(self, query, timeout=DEFAULT_TIMEOUT):
+        return scanner_frame(query, self.get_scanner_data_raw(query, timeout))
+
+    def connections(self):
+        """Connections opened so far across the session's pools."""
+        opened = 0
+        for adapter in set(self.session.adapters.values()):
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is not None:
+                    opened += pool.num_connections
+        return opened
+
+    def stats(self):
+        with self._lock:
+            requests_sent, failures = self.requests, self.failures
+        return {'requests': requests_sent, 'failures': failures, 'connections': self.connections()}
+
+    def close(self):
+        self.session.close()
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def session_for(cookies=None):
+    """The shared session for a cookie jar, created on first use (None: unauthenticated)."""
+    key = id(cookies) if cookies is not None else None
+    with _sessions_lock:
+        entry = _sessions.get(key)
+        # The jar is kept alongside its session so its id cannot be reused while cached
+        if entry is None or entry[0] is not cookies:
+            entry = _sessions[key] = (cookies, ScannerSession(cookies))
+        return entry[1]
+
+
+def get_scanner_data(query, cookies=None, timeout=DEFAULT_TIMEOUT):
+    """Drop-in for `query.get_scanner_data(cookies=..., timeout=...)` over the shared session."""
+    return session_for(cookies).get_scanner_data(query, timeout)
+
+
+def session_stats():
+    with _sessions_lock:
+        sessions = [entry[1] for entry in _sessions.values()]
+    totals = {'sessions': len(sessions), 'requests': 0, 'failures': 0, 'connections': 0}
+    for session in sessions:
+        for field, value in session.stats().items():
+            totals[field] += value
+    return totals
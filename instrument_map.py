@@ -0,0 +1,189 @@
+"""
+Symbol <-> instrument-key lookups backed by the broker's instrument master.
+
+The master (CSV or JSON, optionally gzipped; e.g. the Upstox `complete.csv.gz`) is parsed
+once into two aligned fixed-width arrays, trading symbol and instrument key, sorted by
+symbol, plus the order of the keys. They are saved as `.npy` files next to the source and
+memory-mapped from then on, so restarts and other processes reuse the cache instead of
+re-parsing the master, and share its pages. Lookups in both directions, single or for a
+whole ticker column, are binary searches over the mapped arrays; nothing is copied into
+per-process hash tables. The source is re-read only when its mtime changes, and hit/miss counters are kept
+so unmapped symbols show up as a rate instead of one print per symbol.
+"""
+import glob
+import os
+from collections import Counter
+from time import monotonic
+
+import numpy as np
+import pandas as pd
+
+SYMBOL_COLUMNS = ('trading_symbol', 'tradingsymbol', 'symbol')
+KEY_COLUMNS = ('instrument_key', 'instrument_token')
+# Only cash-market NSE instruments by default; a trading symbol repeats across segments
+DEFAULT_KEY_PREFIX = 'NSE_EQ|'
+# How often lookups may stat the source file for changes
+CHECK_INTERVAL_SECONDS = 5
+MAX_TRACKED_MISSES = 1000
+
+
+def symbol_of(ticker):
+    """'NSE:AXISBANK' -> 'AXISBANK'; plain symbols are returned unchanged."""
+    return ticker.rsplit(':', 1)[-1]
+
+
+def _pick_column(columns, candidates, what):
+    for name in candidates:
+        if name in columns:
+            return name
+    raise ValueError(f"Instrument master has no {what} column (looked for {', '.join(candidates)})")
+
+
+def read_master(path, key_prefix=DEFAULT_KEY_PREFIX):
+    """Parses the instrument master into (symbols, keys) unicode arrays, first occurrence wins."""
+    if path.endswith(('.json', '.json.gz')):
+        df = pd.read_json(path)
+    else:
+        df = pd.read_csv(path, dtype=str, low_memory=False)
+    symbol_col = _pick_column(df.columns, SYMBOL_COLUMNS, 'trading symbol')
+    key_col = _pick_column(df.columns, KEY_COLUMNS, 'instrument key')
+    df = df[[symbol_col, key_col]].dropna().astype(str)
+    if key_prefix:
+        df = df[df[key_col].str.startswith(key_prefix)]
+    df = df.drop_duplicates(subset=[symbol_col]).drop_duplicates(subset=[key_col])
+    return df[symbol_col].to_numpy(dtype=str), df[key_col].to_numpy(dtype=str)
+
+
+def _positions(values, wanted, sorter=None):
+    """Row of each of `wanted` in `values` (sorted, or ordered by `sorter`), -1 where absent."""
+    wanted = np.asarray(wanted, dtype=str)
+    if not len(values) or not len(wanted):
+        return np.full(len(wanted), -1)
+    i = np.minimum(np.searchsorted(values, wanted, sorter=sorter), len(values) - 1)
+    rows = sorter[i] if sorter is not None else i
+    return np.where(values[rows] == wanted, rows, -1)
+
+
+class InstrumentMap:
+    def __init__(self, source, key_prefix=DEFAULT_KEY_PREFIX, check_interval=CHECK_INTERVAL_SECONDS):
+        self.source = source
+        self.key_prefix = key_prefix
+        self.check_interval = check_interval
+        self.version = 0
+        self.lookups = 0
+        self.misses = 0
+        self.missed = Counter()
+        self._mtime = None
+        self._checked_at = None
+        # symbols sorted, keys aligned with them, key_order sorts the keys
+        self._symbols = self._keys = self._key_order = None
+        self.reload_if_changed(force=True)
+
+    def __len__(self):
+        return 0 if self._symbols is None else len(self._symbols)
+
+    def _cache_paths(self, mtime_ns):
+        stem = f'{self.source}.{mtime_ns}'
+        return f'{stem}.symbols.npy', f'{stem}.keys.npy', f'{stem}.key_order.npy'
+
+    def _load_arrays(self, mtime_ns):
+        paths = self._cache_paths(mtime_ns)
+        if not all(os.path.exists(path) for path in paths):
+            symbols, keys = read_master(self.source, self.key_prefix)
+            order = np.argsort(symbols, kind='stable')
+            symbols, keys = symbols[order], keys[order]
+            for path, array in zip(paths, (symbols, keys, np.argsort(keys, kind='stable'))):
+                tmp = f'{path}.tmp'
+                with open(tmp, 'wb') as f:
+                    np.save(f, array)
+                os.replace(tmp, path)
+            # Caches of older versions of the master are no longer needed
+            for stale in glob.glob(glob.escape(self.source) + '.*.npy'):
+                if stale not in paths:
+                    os.remove(stale)
+        return tuple(np.load(path, mmap_mode='r') for path in paths)
+
+    def reload_if_changed(self, force=False):
+        """Re-reads the master when its mtime changed; returns True if the tables were reloaded."""
+        now = monotonic()
+        if not force and self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        try:
+            mtime_ns = os.stat(self.source).st_mtime_ns
+        except OSError as e:
+            if self._symbols is None:
+                print(f"Warning: instrument master {self.source} is not readable: {e}")
+            return False
+        if mtime_ns == self._mtime:
+            return False
+        try:
+            symbols, keys, key_order = self._load_arrays(mtime_ns)
+        except Exception as e:
+            print(f"Error loading instrument master {self.source}: {e}")
+            return False
+        self._symbols, self._keys, self._key_order = symbols, keys, key_order
+        self._mtime = mtime_ns
+        self.version += 1
+        print(f"Loaded {len(symbols)} instruments from {self.source}.")
+        return True
+
+    def _count(self, total, missed):
+        self.lookups += total
+        self.misses += len(missed)
+        if len(missed):
+            self.missed.update(missed)
+            if len(self.missed) > MAX_TRACKED_MISSES:
+                self.missed = Counter(dict(self.missed.most_common(MAX_TRACKED_MISSES // 2)))
+
+    def instrument_key(self, ticker):
+        """Instrument key for 'NSE:AXISBANK' or 'AXISBANK', or None."""
+        self.reload_if_changed()
+        symbol = symbol_of(str(ticker))
+        i = _positions(self._symbols, [symbol])[0] if self._symbols is not None else -1
+        self._count(1, [] if i >= 0 else [symbol])
+        return str(self._keys[i]) if i >= 0 else None
+
+    def symbol(self, instrument_key):
+        """Trading symbol for an instrument key, or None."""
+        self.reload_if_changed()
+        i = _positions(self._keys, [instrument_key], self._key_order)[0] if self._keys is not None else -1
+        self._count(1, [] if i >= 0 else [instrument_key])
+        return str(self._symbols[i]) if i >= 0 else None
+
+    def map_symbols(self, tickers):
+        """Maps a Series of tickers ('NSE:X' or 'X') to instrument keys; misses are NaN."""
+        self.reload_if_changed()
+        symbols = tickers.astype(str).str.rsplit(':', n=1).str[-1]
+        if self._symbols is None:
+            positions = np.full(len(symbols), -1)
+        else:
+            positions = _positions(self._symbols, symbols.to_numpy(dtype=str))
+        hit = positions >= 0
+        keys = np.full(len(symbols), np.nan, dtype=object)
+        keys[hit] = self._keys[positions[hit]]
+        self._count(len(symbols), symbols[~hit].tolist())
+        return pd.Series(keys, index=tickers.index, dtype=object)
+
+    def map_keys(self, keys):
+        """Maps a Series of instrument keys to trading symbols; misses are NaN."""
+        self.reload_if_changed()
+        if self._keys is None:
+            positions = np.full(len(keys), -1)
+        else:
+            positions = _positions(self._keys, keys.astype(str).to_numpy(dtype=str), self._key_order)
+        hit = positions >= 0
+        symbols = np.full(len(keys), np.nan, dtype=object)
+        symbols[hit] = self._symbols[positions[hit]]
+        self._count(len(keys), keys[~hit].astype(str).tolist())
+        return pd.Series(symbols, index=keys.index, dtype=object)
+
+    def stats(self, top=10):
+        return {
+            'instruments': len(self),
+            'version': self.version,
+            'lookups': self.lookups,
+            'misses': self.misses,
+            'miss_rate': self.misses / self.lookups if self.lookups else 0.0,
+            'top_misses': self.missed.most_common(top),
+        }
@@ -0,0 +1,88 @@
+"""
+Trading calendars for the markets the scanner can point at.
+
+A `MarketCalendar` knows its exchange timezone, regular session times, weekend days and
+holidays. Holidays are pluggable: pass any iterable of dates, or keep one ISO date per line
+in a text file (blank lines and `#` comments are ignored) named by the
+`MARKET_HOLIDAYS_FILE` environment variable or `holidays_<market>.txt` in the working directory.
+"""
+import os
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+# Regular sessions keyed by `scanner_settings['market']`
+MARKET_SESSIONS = {
+    'india': ('Asia/Kolkata', time(9, 15), time(15, 30)),
+    'america': ('America/New_York', time(9, 30), time(16, 0)),
+    'uk': ('Europe/London', time(8, 0), time(16, 30)),
+}
+DEFAULT_MARKET = 'india'
+
+
+class MarketCalendar:
+    def __init__(self, tz, session_open, session_close, weekend=(5, 6), holidays=()):
+        self.tz = ZoneInfo(tz) if isinstance(tz, str) else tz
+        self.session_open = session_open
+        self.session_close = session_close
+        self.weekend = frozenset(weekend)
+        self.holidays = frozenset(holidays)
+
+    def is_trading_day(self, day):
+        return day.weekday() not in self.weekend and day not in self.holidays
+
+    def session_bounds(self, day):
+        """(open, close) datetimes of the session on `day`, in exchange time."""
+        return (datetime.combine(day, self.session_open, tzinfo=self.tz),
+                datetime.combine(day, self.session_close, tzinfo=self.tz))
+
+    def now(self):
+        return datetime.now(self.tz)
+
+    def is_open(self, now=None):
+        now = (now or self.now()).astimezone(self.tz)
+        if not self.is_trading_day(now.date()):
+            return False
+        session_open, session_close = self.session_bounds(now.date())
+        return session_open <= now < session_close
+
+    def next_open(self, now=None):
+        """Start of the next session strictly after `now` (or of the current one if it has not started)."""
+        now = (now or self.now()).astimezone(self.tz)
+        day = now.date()
+        for _ in range(366):
+            if self.is_trading_day(day):
+                session_open, _ = self.session_bounds(day)
+                if session_open > now:
+                    return session_open
+            day += timedelta(days=1)
+        return None
+
+    def next_trading_day(self, day):
+        following = day + timedelta(days=1)
+        while not self.is_trading_day(following):
+            following += timedelta(days=1)
+        return following
+
+
+def load_holidays(path):
+    """Reads one ISO date per line; a missing file means no holidays."""
+    if not path or not os.path.exists(path):
+        return set()
+    holidays = set()
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                holidays.add(date.fromisoformat(line))
+    return holidays
+
+
+def get_calendar(market, holidays=None):
+    """Calendar for a scanner market; holidays default to the configured holiday file."""
+    if market not in MARKET_SESSIONS:
+        print(f"Warning: no trading calendar for market '{market}', using '{DEFAULT_MARKET}' hours.")
+        market = DEFAULT_MARKET
+    tz, session_open, session_close = MARKET_SESSIONS[market]
+    if holidays is None:
+        holidays = load_holidays(os.environ.get('MARKET_HOLIDAYS_FILE', f'holidays_{market}.txt'))
+    return MarketCalendar(tz, session_open, session_close, holidays=holidays)
@@ -0,0 +1,102 @@
+"""
+TTL + LRU cache around `Query.get_scanner_data`.
+
+Entries are keyed by a hash of the query's endpoint and its serialized payload, so
+identical queries rebuilt from scratch each sweep share one entry. An entry for
+timeframe suffixes `tfs` lives until the earliest of their next bar closes on the
+market calendar (falling back to one bar length when the calendar has no upcoming
+close), so a weekly or monthly query is sent once per bar instead of once per sweep.
+Failed fetches are never cached. Cached frames are copied on the way in and out, so
+callers may modify what they get back.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+import http_session
+from market_calendar import get_calendar
+from scheduler import BAR_MINUTES, next_bar_close
+
+DEFAULT_MAX_ENTRIES = 128
+
+# Fallback entry lifetimes for bars without a calendar close
+_PERIOD_TTL = {'': timedelta(days=1), '|1W': timedelta(days=7), '|1M': timedelta(days=28)}
+
+
+def query_key(query):
+    """Stable hash of a query's endpoint and payload."""
+    payload = json.dumps(query.query, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(f'{query.url}\n{payload}'.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def bar_ttl(tf):
+    if tf in BAR_MINUTES:
+        return timedelta(minutes=BAR_MINUTES[tf])
+    return _PERIOD_TTL.get(tf, timedelta(minutes=5))
+
+
+class QueryCache:
+    def __init__(self, calendar=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.calendar = calendar or get_calendar('india')
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def expires_at(self, tfs, now=None):
+        """When results covering timeframe suffixes `tfs` go stale: the earliest next bar close."""
+        now = now or self.calendar.now()
+        expiries = []
+        for tf in tfs:
+            close = next_bar_close(tf, now, self.calendar)
+            expiries.append(close if close is not None else now + bar_ttl(tf))
+        return min(expiries) if expiries else now
+
+    def get_scanner_data(self, query, tfs, fetch=None, **kwargs):
+        """
+        Same result as `query.get_scanner_data(**kwargs)`, served from the cache while
+        the bars of `tfs` have not closed. Misses go through `fetch(query, **kwargs)`, by
+        default the pooled session for the cookies given (e.g. `executor.QueryExecutor.
+        get_scanner_data` to add retries). Request options are not part of the key.
+        """
+        key = query_key(query)
+        now = self.calendar.now()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                count, df = entry[1]
+                return count, None if df is None else df.copy()
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+
+        # Fetched outside the lock; concurrent misses for the same key both go to the network
+        count, df = (fetch or http_session.get_scanner_data)(query, **kwargs)
+        with self._lock:
+            self._entries[key] = (self.expires_at(tfs, now), (count, None if df is None else df.copy()))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return count, df
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,131 @@
+"""
+Column-oriented serialization of scan DataFrames.
+
+Every field is converted once per column (NaN/NaT -> None, numpy scalars -> Python
+values, timestamps -> ISO strings or datetimes) instead of once per row, so building a
+payload for a few hundred symbols costs a handful of array operations.
+
+Heatmap: `heatmap_columns` returns the columnar form (field -> list) the D3 heatmap can
+consume directly; `heatmap_records` zips it into the flat list of dicts the existing pages
+expect.
+
+Documents: `iter_documents` streams BSON-ready dicts for MongoDB and `insert_documents`
+writes them in fixed-size `insert_many` batches.
+"""
+from datetime import datetime
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+# Output field -> (source column, value used when the column is missing, NaN replacement)
+HEATMAP_FIELDS = {
+    'name': ('ticker', 0, None),
+    'value': ('HeatmapScore', 0, None),
+    'count': ('SqueezeCount', 0, 0),
+    'rvol': ('rvol', 0, None),
+    'url': ('URL', 0, None),
+    'logo': ('logo', 0, None),
+    'momentum': ('momentum', 'N/A', None),
+    'highest_tf': ('highest_tf', 'N/A', None),
+    'squeeze_strength': ('squeeze_strength', 'N/A', None),
+}
+# Only emitted when the frame has them (fired tables)
+OPTIONAL_HEATMAP_FIELDS = ['fired_timeframe', 'previous_volatility', 'current_volatility', 'volatility_increased']
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def column_values(series, missing=None):
+    """A column as a list of Python values, with NaN/NaT replaced by `missing`."""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return [missing if pd.isna(v) else v.isoformat() for v in series]
+    values = series.astype(object).where(series.notna(), missing) if series.hasnans or series.dtype == object else series
+    return values.tolist()
+
+
+def timestamp_values(series, missing=None):
+    """Timestamps (or anything else) as ISO strings, with missing values replaced by `missing`."""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return column_values(series, missing)
+    return [missing if v is None or (not isinstance(v, str) and pd.isna(v)) else _isoformat(v) for v in series]
+
+
+def heatmap_columns(df):
+    """Builds the heatmap payload in columnar form: {field: [value per symbol]}."""
+    if df is None or df.empty:
+        return {field: [] for field in HEATMAP_FIELDS}
+    n = len(df)
+    columns = {}
+    for field, (source, default, nan_value) in HEATMAP_FIELDS.items():
+        columns[field] = column_values(df[source], nan_value) if source in df.columns else [default] * n
+    for field in OPTIONAL_HEATMAP_FIELDS:
+        if field in df.columns:
+            columns[field] = column_values(df[field])
+    if 'fired_timestamp' in df.columns:
+        columns['fired_timestamp'] = timestamp_values(df['fired_timestamp'])
+    return columns
+
+
+def heatmap_records(df):
+    """The heatmap payload as a list of per-symbol dicts."""
+    columns = heatmap_columns(df)
+    fields = list(columns)
+    return [dict(zip(fields, values)) for values in zip(*columns.values())]
+
+
+def document_values(series):
+    """A column coerced to BSON-encodable Python values: bool, int, float, datetime, str or None."""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        values = pd.Series(series.dt.to_pydatetime(), index=series.index, dtype=object)
+        return values.where(series.notna(), None).tolist()
+    if pd.api.types.is_bool_dtype(series.dtype) or pd.api.types.is_integer_dtype(series.dtype):
+        return series.tolist()
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.astype(float).astype(object).where(series.notna(), None).tolist()
+    values = series.astype(object).where(series.notna(), None)
+    if pd.api.types.is_string_dtype(series.dtype) and series.dtype != object:
+        return values.tolist()
+    # Object columns may still hold numpy scalars
+    return [v.item() if isinstance(v, np.generic) else v for v in values]
+
+
+def iter_documents(df, required=('ticker',)):
+    """
+    Yields one BSON-ready dict per row. Rows with an empty value in any `required` column
+    are skipped; the filter is a single mask, not a pass over the documents.
+    """
+    if df is None or df.empty:
+        return
+    keep = np.ones(len(df), dtype=bool)
+    for column in required:
+        if column not in df.columns:
+            return
+        values = df[column]
+        keep &= values.notna().to_numpy() & (values.astype(str) != '').to_numpy()
+    df = df[keep]
+    fields = [str(c) for c in df.columns]
+    columns = [document_values(df[c]) for c in df.columns]
+    for values in zip(*columns):
+        yield dict(zip(fields, values))
+
+
+def document_batches(documents, batch_size=1000):
+    """Groups an iterable of documents into lists of at most `batch_size`."""
+    documents = iter(documents)
+    while True:
+        batch = list(islice(documents, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def insert_documents(collection, df, batch_size=1000, required=('ticker',)):
+    """Inserts a DataFrame into a MongoDB collection in unordered batches; returns the count written."""
+    inserted = 0
+    for batch in document_batches(iter_documents(df, required), batch_size):
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
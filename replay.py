@@ -0,0 +1,287 @@
+"""
+Replay stored sweeps through the intraday signal logic.
+
+Reads the sweeps persisted by `storage.SweepStore` from the `scans` table in timestamp
+order, re-evaluates the per-timeframe rules of `scan.build_timeframe_filters` with the
+given volume settings, and reports, per rule and timeframe, how many signals fired and
+the forward returns that followed.
+
+Stored rows are what the live screener returned, i.e. symbols that already passed the
+live filter on that timeframe. Replays can therefore tighten the thresholds (raise
+`VOLUME_THRESHOLDS` or the volume multiple) but cannot find signals looser settings would
+have added.
+
+The same limit applies to forward returns. Prices come from every stored row on every
+timeframe, but a symbol only has a row in sweeps where the screener returned it. A signal
+whose symbol dropped out of the results has no forward price. Each horizon is therefore
+reported with `coverage_<h>m`, the share of signals that could be priced, and the mean
+returns and hit rates only describe that share.
+
+Example:
+    python replay.py --start 2026-10-01 --threshold "|5=50000" --volume-multiple 3 --horizons 15 60
+"""
+import argparse
+import sqlite3
+from itertools import chain, repeat
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+from tradingview_screener import And, Or
+
+from evaluator import SnapshotEvaluator
+from scan import VOLUME_THRESHOLDS, build_timeframe_filters, tf_display_map, timeframes
+from storage import DB_PATH, text_values, unpack_blocks, unpack_frame
+
+DEFAULT_HORIZONS = (15, 60, 240)  # minutes
+
+
+def _utc_iso(value):
+    ts = pd.Timestamp(value)
+    return (ts.tz_localize('UTC') if ts.tz is None else ts.tz_convert('UTC')).isoformat()
+
+
+def _select_sweeps(conn, start, end, market):
+    clauses, params = ['payload IS NOT NULL'], []
+    if start:
+        clauses.append('ts_utc >= ?')
+        params.append(_utc_iso(start))
+    if end:
+        clauses.append('ts_utc < ?')
+        params.append(_utc_iso(end))
+    if market:
+        clauses.append('market = ?')
+        params.append(market)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(scans)')}
+    if 'payload' not in columns:
+        return iter(())
+    sql = 'SELECT id, ts_utc, payload_format, payload FROM scans WHERE ' + ' AND '.join(clauses) + ' ORDER BY ts_utc, id'
+    return conn.execute(sql, params)
+
+
+def iter_sweeps(db_path=DB_PATH, start=None, end=None, market=None):
+    """Yields (scan_id, timestamp, raw frame) for stored sweeps in timestamp order."""
+    conn = sqlite3.connect(db_path)
+    try:
+        for scan_id, ts_utc, fmt, payload in _select_sweeps(conn, start, end, market):
+            yield scan_id, pd.Timestamp(ts_utc), unpack_frame(fmt, payload)
+    finally:
+        conn.close()
+
+
+def _text_list(sweep, name, n):
+    _, text, objects = sweep
+    if name in objects:
+        return objects[name]
+    if name in text:
+        return text_values(*text[name])
+    return repeat(None, n)
+
+
+def load_sweeps(db_path=DB_PATH, start=None, end=None, market=None):
+    """
+    Concatenates stored sweeps into one long frame with `scan_id` and `ts` columns.
+
+    Sweeps are decoded into per-dtype blocks and copied into one preallocated matrix per
+    dtype, so the work per sweep is a few array copies whatever its column count. Sweeps
+    with the same columns share the copy plan, and text columns come back as categoricals.
+    """
+    sweeps, sizes, scan_ids, stamps = [], [], [], []
+    conn = sqlite3.connect(db_path)
+    try:
+        for scan_id, ts_utc, fmt, payload in _select_sweeps(conn, start, end, market):
+            blocks, text, objects, n = unpack_blocks(fmt, payload)
+            if n:
+                sweeps.append((blocks, text, objects))
+                sizes.append(n)
+                scan_ids.append(scan_id)
+                stamps.append(ts_utc)
+    finally:
+        conn.close()
+    if not sweeps:
+        return pd.DataFrame(), 0
+
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    total = int(offsets[-1])
+    # Sweeps that scanned the same timeframes have the same block layout
+    layouts = {}
+    for i, (blocks, _, _) in enumerate(sweeps):
+        layouts.setdefault(tuple((dtype, tuple(names)) for dtype, names, _ in blocks), []).append(i)
+
+    dtypes, present = {}, {}
+    for layout, members in layouts.items():
+        for dtype, names in layout:
+            for name in names:
+                dtypes.setdefault(name, set()).add(dtype)
+                present[name] = present.get(name, 0) + len(members)
+    # A column keeps its dtype when every sweep has it in that dtype; otherwise it needs
+    # a missing value: NaT for datetimes, NaN (as float64) for everything else
+    targets = {}
+    for name, seen in dtypes.items():
+        kinds = {np.dtype(d).kind for d in seen}
+        if len(seen) == 1 and (present[name] == len(sweeps) or kinds <= {'f', 'M'}):
+            targets[name] = next(iter(seen))
+        else:
+            targets[name] = '<f8' if 'M' not in kinds else 'O'
+    matrices, rows = {}, {}
+    for target in dict.fromkeys(targets.values()):
+        names = [name for name in targets if targets[name] == target]
+        kind = np.dtype(target).kind
+        if kind in 'biu':
+            # Only columns every sweep has keep an integer or boolean dtype
+            matrices[target] = np.empty((len(names), total), dtype=target)
+        else:
+            fill = np.nan if kind == 'f' else np.datetime64('NaT') if kind == 'M' else None
+            matrices[target] = np.full((len(names), total), fill, dtype=target)
+        rows.update({name: (target, r) for r, name in enumerate(names)})
+
+    for layout, members in layouts.items():
+        plan = []
+        for b, (_, names) in enumerate(layout):
+            by_target = {}
+            for i, name in enumerate(names):
+                target, r = rows[name]
+                by_target.setdefault(target, ([], []))
+                by_target[target][0].append(i)
+                by_target[target][1].append(r)
+            plan.extend((b, target, np.array(src), np.array(dst)) for target, (src, dst) in by_target.items())
+        for s in members:
+            blocks, (start, stop) = sweeps[s][0], offsets[s:s + 2]
+            for b, target, src, dst in plan:
+                matrices[target][dst, start:stop] = blocks[b][2][src]
+
+    columns = {name: matrices[target][r] for name, (target, r) in rows.items()}
+    listed = {name for _, _, objects in sweeps for name in objects}
+    for name in dict.fromkeys(name for _, text, objects in sweeps for name in chain(text, objects)):
+        if name in listed:
+            # Older payloads carry text as plain lists, so decode everything to lists
+            columns[name] = list(chain.from_iterable(_text_list(sweep, name, n) for sweep, n in zip(sweeps, sizes)))
+            continue
+        # Dictionary-encoded text becomes one categorical: each sweep's codes are mapped onto
+        # the union of its distinct values. Sweeps without the column stay missing (-1)
+        categories, codes = {}, np.full(total, -1, dtype=np.int32)
+        for (_, text, _), start, stop in zip(sweeps, offsets[:-1], offsets[1:]):
+            if name in text:
+                uniques, sweep_codes = text[name]
+                remap = np.array([categories.setdefault(u, len(categories)) for u in uniques] + [-1], dtype=np.int32)
+                codes[start:stop] = remap[sweep_codes]
+        columns[name] = pd.Categorical.from_codes(codes, list(categories))
+    history = pd.DataFrame(columns)
+    history['scan_id'] = np.repeat(scan_ids, sizes)
+    history['ts'] = pd.to_datetime(np.repeat(stamps, sizes), format='ISO8601', utc=True)
+    return history, len(sweeps)
+
+
+def build_rules(tf, volume_thresholds=None, volume_multiple=2):
+    """The rules reported by a replay, built from the live filter definitions."""
+    signals = build_timeframe_filters(tf, volume_thresholds, volume_multiple)
+    return {
+        'vol_spike': signals['vol_spike'],
+        'donchian_break': And(signals['vol_spike'], signals['donchian_break']),
+        'squeeze_breakout': And(signals['vol_spike'], signals['squeeze_breakout']),
+        'fired': And(signals['vol_spike'], Or(signals['donchian_break'], signals['squeeze_breakout'])),
+    }
+
+
+def forward_returns(signals, prices, horizons):
+    """
+    Adds `ret_<h>m` columns: the return from each signal's close to the first later
+    observation of the same symbol between `h` and `2h` minutes on. Symbols are only
+    observed in sweeps where they were returned, so signals without such an observation
+    have no forward price (NaN) rather than one taken from much later.
+    """
+    signals = signals.sort_values('ts')
+    for h in horizons:
+        horizon = pd.Timedelta(minutes=h)
+        target = signals[['ts', 'name']].assign(ts=signals['ts'] + horizon)
+        ahead = pd.merge_asof(target.reset_index(), prices, on='ts', by='name', direction='forward',
+                              tolerance=horizon).set_index('index')
+        signals[f'ret_{h}m'] = ahead['close'].reindex(signals.index) / signals['close'] - 1
+    return signals
+
+
+def replay(db_path=DB_PATH, start=None, end=None, market=None, volume_thresholds=None, volume_multiple=2,
+           horizons=DEFAULT_HORIZONS):
+    """Returns (report DataFrame, stats dict) for the stored sweeps in range."""
+    started = perf_counter()
+    history, n_sweeps = load_sweeps(db_path, start, end, market)
+    loaded = perf_counter()
+    if history.empty:
+        return pd.DataFrame(), {'sweeps': n_sweeps, 'rows': 0, 'seconds': loaded - started}
+
+    thresholds = {**VOLUME_THRESHOLDS, **(volume_thresholds or {})}
+    history['close'] = pd.to_numeric(history['close'], errors='coerce')
+    prices = (history[['ts', 'name', 'close']].dropna()
+              .drop_duplicates(subset=['ts', 'name']).sort_values('ts'))
+
+    signal_frames = []
+    for tf in timeframes:
+        rows = history[history['timeframe'] == tf]
+        if rows.empty:
+            continue
+        # One evaluator per timeframe so the rules share converted columns
+        evaluator = SnapshotEvaluator(rows)
+        for rule, expression in build_rules(tf, thresholds, volume_multiple).items():
+            hits = rows[evaluator.evaluate(expression)]
+            if not hits.empty:
+                signal_frames.append(hits[['ts', 'name', 'close', 'MACD.hist']].assign(rule=rule, timeframe=tf))
+
+    if not signal_frames:
+        return pd.DataFrame(), {'sweeps': n_sweeps, 'rows': len(history), 'seconds': perf_counter() - started}
+
+    signals = forward_returns(pd.concat(signal_frames, ignore_index=True), prices, horizons)
+    # Long on bullish momentum, short on bearish, so both breakout directions score alike
+    direction = np.sign(pd.to_numeric(signals['MACD.hist'], errors='coerce')).replace(0, np.nan)
+
+    aggregations = {'signals': ('name', 'size'), 'symbols': ('name', 'nunique')}
+    for h in horizons:
+        signals[f'dir_{h}m'] = signals[f'ret_{h}m'] * direction
+        aggregations[f'mean_ret_{h}m'] = (f'ret_{h}m', 'mean')
+        aggregations[f'mean_dir_ret_{h}m'] = (f'dir_{h}m', 'mean')
+        aggregations[f'hit_rate_{h}m'] = (f'dir_{h}m', lambda r: (r > 0).sum() / r.notna().sum() if r.notna().any() else np.nan)
+        aggregations[f'coverage_{h}m'] = (f'ret_{h}m', lambda r: r.notna().mean())
+
+    report = signals.groupby(['rule', 'timeframe']).agg(**aggregations).reset_index()
+    report['timeframe'] = report['timeframe'].map(tf_display_map)
+    elapsed = perf_counter() - started
+    return report, {'sweeps': n_sweeps, 'rows': len(history), 'seconds': elapsed, 'load_seconds': loaded - started}
+
+
+def _threshold(value):
+    """Parses one --threshold TF=VOLUME argument into (timeframe suffix, volume)."""
+    tf, _, threshold = value.partition('=')
+    if tf not in VOLUME_THRESHOLDS:
+        raise argparse.ArgumentTypeError(f"unknown timeframe suffix {tf!r} (expected one of {', '.join(map(repr, VOLUME_THRESHOLDS))})")
+    try:
+        return tf, float(threshold)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid volume {threshold!r} for timeframe {tf!r}") from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay stored sweeps against new signal thresholds.')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--start', help='inclusive start (ISO date/time, UTC unless offset given)')
+    parser.add_argument('--end', help='exclusive end (ISO date/time, UTC unless offset given)')
+    parser.add_argument('--market')
+    parser.add_argument('--threshold', action='append', type=_threshold, metavar='TF=VOLUME',
+                        help='override a VOLUME_THRESHOLDS entry, e.g. "|5=50000" (repeatable)')
+    parser.add_argument('--volume-multiple', type=float, default=2, help='volume must exceed this multiple of the 10d average')
+    parser.add_argument('--horizons', type=int, nargs='+', default=list(DEFAULT_HORIZONS), help='forward return horizons in minutes')
+    args = parser.parse_args(argv)
+
+    report, stats = replay(args.db, args.start, args.end, args.market, dict(args.threshold or ()),
+                           args.volume_multiple, args.horizons)
+    rate = stats['sweeps'] / stats['seconds'] if stats['seconds'] else float('inf')
+    print(f"Replayed {stats['sweeps']} sweeps ({stats['rows']} rows) in {stats['seconds']:.3f}s ({rate:,.0f} sweeps/s)")
+    if report.empty:
+        print("No signals fired in the selected range.")
+    else:
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(report.to_string(index=False, float_format=lambda v: f'{v:.4f}'))
+        print("Forward prices only exist where the screener returned the symbol again; returns and hit rates "
+              "cover the coverage_<h>m share of signals.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,11 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from tradingview_screener import Query, col, And, Or
+import numpy as np
 import pandas as pd
+from enrichment import enrich_frame
+from evaluator import SnapshotEvaluator
+import http_session
+from compact import compact_frame
 
 VOLUME_THRESHOLDS = {
     '|3': 15000,
@@ -19,72 +25,406 @@ tf_order_map = {'|1M': 10, '|1W': 9 , '': 8, '|240':7 , '|120': 6, '|60': 5, '|3
 tf_display_map = {'|3': '3m', '|5': '5m', '|15': '15m', '|30': '30m', '|60': '1H', '|120': '2H', '|240': '4H','': 'Daily', '|1W': 'Weekly', '|1M': 'Monthly'}
 tf_suffix_map = {v: k for k, v in tf_display_map.items()}
 
-# Construct select columns for all timeframes
-select_cols = ['name', 'logoid', 'close', 'MACD.hist', 'relative_volume_10d_calc']
-for tf in timeframes:
-    select_cols.extend([
-        f'KltChnl.lower{tf}', f'KltChnl.upper{tf}', f'BB.lower{tf}', f'BB.upper{tf}',
-        f'ATR{tf}', f'SMA20{tf}', f'volume{tf}', f'average_volume_10d_calc{tf}', f'Value.Traded{tf}'
-    ])
-
-def run_intraday_scan(settings, cookies):
-    if cookies is None:
-        return {"fired": pd.DataFrame()}
-
-    all_results = []
-    
-    base_filters = [
-        col('beta_1_year') > 1.2,
-        col('is_primary') == True,
-        col('typespecs').has('common'),
-        col('type') == 'stock',
-        col('exchange') == 'NSE',
-        col('active_symbol') == True,
+# Execution defaults, overridable per sweep through the scanner settings
+DEFAULT_SCAN_MODE = 'sequential'
+MAX_CONCURRENT_QUERIES = 5
+QUERY_TIMEOUT = 20
+# The screener returns 50 rows per query by default; the combined query covers several timeframes at once
+ROWS_PER_TIMEFRAME = 50
+# Symbols (or result rows) per request in the sharded mode
+SHARD_SIZE = 500
+
+# Per-symbol columns every query returns
+base_cols = ['name', 'logoid', 'close', 'MACD.hist', 'relative_volume_10d_calc']
+
+# Squeeze state and band width; read on every timeframe for squeeze_count, highest_squeeze_tf
+# and squeeze_strength and by the transition tracker, whichever timeframe a row fired on
+def squeeze_cols(tf):
+    return [f'KltChnl.lower{tf}', f'KltChnl.upper{tf}', f'BB.lower{tf}', f'BB.upper{tf}', f'ATR{tf}', f'SMA20{tf}']
+
+# Volume columns; only read on the timeframe a row fired on (volume spike, rvol)
+def timeframe_volume_cols(tf):
+    return [f'volume{tf}', f'average_volume_10d_calc{tf}']
+
+# Every column for all timeframes, as selected before projection; Value.Traded is not read anywhere
+select_cols = base_cols + [c for tf in timeframes for c in squeeze_cols(tf) + timeframe_volume_cols(tf) + [f'Value.Traded{tf}']]
+
+# Donchian and previous-bar columns needed to re-derive a timeframe's signals locally
+def timeframe_signal_cols(tf):
+    return [
+        f'DonchCh20.Upper{tf}', f'DonchCh20.Upper[1]{tf}', f'DonchCh20.Lower{tf}', f'DonchCh20.Lower[1]{tf}',
+        f'KltChnl.lower[1]{tf}', f'KltChnl.upper[1]{tf}', f'BB.lower[1]{tf}', f'BB.upper[1]{tf}'
     ]
 
-    for tf in timeframes:
-        donchian_break = Or(
-            col(f'DonchCh20.Upper{tf}') > col(f'DonchCh20.Upper[1]{tf}'),
-            col(f'DonchCh20.Lower{tf}') < col(f'DonchCh20.Lower[1]{tf}')
-        )
+signal_cols = [c for tf in timeframes for c in timeframe_signal_cols(tf)]
 
-        squeeze_breakout = Or(
-            And(
-                col(f'BB.upper[1]{tf}') < col(f'KltChnl.upper[1]{tf}'),
-                col(f'BB.upper{tf}') >= col(f'KltChnl.upper{tf}')
-            ),
-            And(
-                col(f'BB.lower[1]{tf}') > col(f'KltChnl.lower[1]{tf}'),
-                col(f'BB.lower{tf}') <= col(f'KltChnl.lower{tf}')
-            )
-        )
+def plan_columns(tfs):
+    """
+    Columns a query scanning timeframes `tfs` needs: the base and squeeze columns of every
+    timeframe, plus the volume and signal columns of `tfs` only.
+    """
+    return (base_cols + [c for tf in timeframes for c in squeeze_cols(tf)]
+            + [c for tf in tfs for c in timeframe_volume_cols(tf) + timeframe_signal_cols(tf)])
+
+def unprojected_columns(tfs, combined=False):
+    """What the query for `tfs` selected before projection: every timeframe's columns."""
+    return select_cols + (signal_cols if combined else [c for tf in tfs for c in timeframe_signal_cols(tf)])
+
+def estimate_bytes_saved(df, dropped):
+    """Response bytes not downloaded: rows x dropped columns x the mean JSON size of a value in `df`."""
+    if df is None or df.empty or not dropped:
+        return 0
+    values = df.select_dtypes('number')
+    if values.empty:
+        return 0
+    per_value = len(values.to_json(orient='values')) / values.size
+    return int(len(df) * dropped * per_value)
+
+def projection_report(frames, tfs, combined=False):
+    """
+    Per sweep, summed over the timeframe (or combined) queries: columns requested, columns
+    no longer requested, and the estimated response bytes saved.
+    """
+    groups = [list(tfs)] if combined else [[tf] for tf in tfs]
+    report = {'columns': 0, 'dropped': 0, 'bytes_saved': 0}
+    for group in groups:
+        planned = len(plan_columns(group))
+        dropped = len(unprojected_columns(group, combined)) - planned
+        returned = [frames[tf] for tf in group if frames.get(tf) is not None]
+        # A combined row fires on several timeframes but was downloaded once
+        df = pd.concat(returned).drop_duplicates(subset=['ticker']) if returned else None
+        report['columns'] += planned
+        report['dropped'] += dropped
+        report['bytes_saved'] += estimate_bytes_saved(df, dropped)
+    return report
 
-        vol_spike = And(
-            col(f'volume{tf}') > VOLUME_THRESHOLDS[tf],
-            col(f'volume{tf}').above_pct(col(f'average_volume_10d_calc{tf}'), 2)
+base_filters = [
+    col('beta_1_year') > 1.2,
+    col('is_primary') == True,
+    col('typespecs').has('common'),
+    col('type') == 'stock',
+    col('exchange') == 'NSE',
+    col('active_symbol') == True,
+]
+
+def build_timeframe_filters(tf, volume_thresholds=None, volume_multiple=2):
+    """
+    Returns the named signal filters for a single timeframe suffix. The volume parameters
+    default to the live settings and are only overridden by offline replays.
+    """
+    volume_thresholds = volume_thresholds or VOLUME_THRESHOLDS
+    donchian_break = Or(
+        col(f'DonchCh20.Upper{tf}') > col(f'DonchCh20.Upper[1]{tf}'),
+        col(f'DonchCh20.Lower{tf}') < col(f'DonchCh20.Lower[1]{tf}')
+    )
+
+    squeeze_breakout = Or(
+        And(
+            col(f'BB.upper[1]{tf}') < col(f'KltChnl.upper[1]{tf}'),
+            col(f'BB.upper{tf}') >= col(f'KltChnl.upper{tf}')
+        ),
+        And(
+            col(f'BB.lower[1]{tf}') > col(f'KltChnl.lower[1]{tf}'),
+            col(f'BB.lower{tf}') <= col(f'KltChnl.lower{tf}')
         )
+    )
+
+    vol_spike = And(
+        col(f'volume{tf}') > volume_thresholds[tf],
+        col(f'volume{tf}').above_pct(col(f'average_volume_10d_calc{tf}'), volume_multiple)
+    )
+
+    return {
+        'vol_spike': vol_spike,
+        'donchian_break': donchian_break,
+        'squeeze_breakout': squeeze_breakout,
+    }
+
+def _restrict(query, filters, settings, tickers=None):
+    """
+    Applies `filters` after the base filters on the settings' market or, given the
+    pre-resolved `tickers` of a `universe.Universe`, on just those symbols.
+    """
+    if tickers:
+        return query.where2(And(*filters)).set_tickers(*tickers)
+    return query.where2(And(*base_filters, *filters)).set_markets(settings['market'])
+
+def build_timeframe_query(tf, settings, tickers=None):
+    signals = build_timeframe_filters(tf)
+    filters = [signals['vol_spike'], Or(signals['donchian_break'], signals['squeeze_breakout'])]
+    # The signal columns are stored with each sweep so replays can re-evaluate the filters
+    return _restrict(Query().select(*plan_columns([tf])), filters, settings, tickers)
+
+def build_combined_query(settings, tfs=None, tickers=None):
+    """Builds a single query matching a symbol when any timeframe's signal block fires."""
+    tfs = tfs or timeframes
+    blocks = []
+    for tf in tfs:
+        signals = build_timeframe_filters(tf)
+        blocks.append(And(signals['vol_spike'], Or(signals['donchian_break'], signals['squeeze_breakout'])))
+    query = Query().select(*plan_columns(tfs))
+    return _restrict(query, [Or(*blocks)], settings, tickers).limit(ROWS_PER_TIMEFRAME * len(tfs))
+
+def timeframe_signal_mask(df, tf, evaluator=None):
+    """
+    Evaluates the same per-timeframe filter as `build_timeframe_query` over the returned
+    columns. Comparisons against NaN are False, so a missing indicator never fires.
+    """
+    evaluator = evaluator or SnapshotEvaluator(df)
+    signals = build_timeframe_filters(tf)
+    return evaluator.evaluate(And(signals['vol_spike'], Or(signals['donchian_break'], signals['squeeze_breakout'])))
+
+def split_by_timeframe(df, tfs=None):
+    """Splits a combined-query frame into per-timeframe frames of the symbols that fired there."""
+    frames = {}
+    evaluator = SnapshotEvaluator(df)
+    for tf in tfs or timeframes:
+        mask = timeframe_signal_mask(df, tf, evaluator)
+        frames[tf] = df[mask].assign(timeframe=tf) if mask.any() else None
+    return frames
+
+def scanner_fetch(cookies, timeout=QUERY_TIMEOUT, cache=None, executor=None):
+    """
+    `fetch(query, tfs) -> (count, df)`: `query.get_scanner_data` over the pooled session
+    for `cookies`, sent through an `executor.QueryExecutor` (rate limit, retries, circuit
+    breaker) when one is given and served from a `query_cache.QueryCache` until the bars
+    of `tfs` close.
+    """
+    send = executor.get_scanner_data if executor is not None else http_session.get_scanner_data
 
-        filters = base_filters + [vol_spike, Or(donchian_break, squeeze_breakout)]
-        query = Query().select(*select_cols).where2(And(*filters)).set_markets(settings['market'])
+    def fetch(query, tfs):
+        if cache is None:
+            return send(query, cookies=cookies, timeout=timeout)
+        return cache.get_scanner_data(query, tfs, fetch=send, cookies=cookies, timeout=timeout)
+    return fetch
 
-        try:
-            print(f"Running intraday scan for timeframe: {tf or '1D'}")
-            _, df = query.get_scanner_data(cookies=cookies)
-            if df is not None and not df.empty:
-                df['timeframe'] = tf
-                all_results.append(df)
-        except Exception as e:
-            print(f"Error in intraday scan for {tf or '1D'}: {e}")
+def fetch_timeframe(tf, query, fetch):
+    """
+    Runs one timeframe query. Returns (rows tagged with the timeframe or None, error or
+    None); an error means the timeframe could not be scanned, not that nothing fired.
+    """
+    try:
+        print(f"Running intraday scan for timeframe: {tf or '1D'}")
+        _, df = fetch(query, [tf])
+    except Exception as e:
+        print(f"Error in intraday scan for {tf or '1D'}: {e}")
+        return None, str(e) or e.__class__.__name__
+    if df is not None and not df.empty:
+        df['timeframe'] = tf
+        return df, None
+    return None, None
 
+def _collect(results):
+    frames = {tf: df for tf, (df, _) in results.items()}
+    errors = {tf: error for tf, (_, error) in results.items() if error is not None}
+    return frames, errors
+
+def _fetch_sequential(queries, fetch):
+    return _collect({tf: fetch_timeframe(tf, query, fetch) for tf, query in queries.items()})
+
+def _fetch_concurrent(queries, fetch, max_workers, deadline):
+    """
+    Sends the per-timeframe queries together on a bounded pool. Queries that have not
+    answered within `deadline` seconds of starting are reported as failed for this sweep.
+    """
+    workers = max(1, min(max_workers, len(queries)))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan')
+    futures = {tf: pool.submit(fetch_timeframe, tf, query, fetch) for tf, query in queries.items()}
+    # Queued queries only start once a worker frees up, so the deadline covers every round.
+    # requests enforces its timeout per socket operation, hence the slack on the wall clock.
+    rounds = -(-len(queries) // workers)
+    wait(futures.values(), timeout=rounds * deadline + 5)
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    results = {}
+    for tf, future in futures.items():
+        if future.done() and not future.cancelled():
+            results[tf] = future.result()
+        else:
+            print(f"Error in intraday scan for {tf or '1D'}: timed out after {deadline:.0f}s")
+            results[tf] = (None, f"timed out after {deadline:.0f}s")
+    return _collect(results)
+
+def ticker_shards(tickers, shard_size=SHARD_SIZE):
+    return [tickers[i:i + shard_size] for i in range(0, len(tickers), shard_size)]
+
+def _fetch_shard(tf, query, fetch):
+    """One shard of a timeframe scan: (match count, rows tagged with the timeframe or None)."""
+    count, df = fetch(query, [tf])
+    if df is not None and not df.empty:
+        df['timeframe'] = tf
+        return count, df
+    return count, None
+
+def _fetch_sharded(settings, fetch, tfs, max_workers, deadline, shard_size=SHARD_SIZE, tickers=None):
+    """
+    Splits each timeframe's scan into requests of at most `shard_size` symbols: slices of
+    `tickers`, or result pages (ordered by name) when there is no universe list. Shards of
+    every timeframe share one bounded pool and each shard's rows are folded into its
+    timeframe as it arrives, so only the shards in flight are held as raw responses. A
+    timeframe with any failed shard is reported as failed.
+    """
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='shard')
+    pending = {}
+
+    def submit(tf, query, paged=False):
+        pending[pool.submit(_fetch_shard, tf, query, fetch)] = (tf, paged)
+
+    for tf in tfs:
+        if tickers:
+            shards = ticker_shards(tickers, shard_size)
+            print(f"Running sharded intraday scan for {tf or '1D'}: {len(shards)} shards")
+            for shard in shards:
+                submit(tf, build_timeframe_query(tf, settings, shard).limit(len(shard)))
+        else:
+            # Further pages are only known once the first one reports the match count
+            print(f"Running paged intraday scan for {tf or '1D'}")
+            submit(tf, build_timeframe_query(tf, settings).order_by('name').limit(shard_size), paged=True)
+
+    parts = {tf: [] for tf in tfs}
+    errors = {}
+    while pending:
+        done, _ = wait(pending, timeout=deadline + 5, return_when=FIRST_COMPLETED)
+        if not done:
+            for tf, _ in pending.values():
+                print(f"Error in intraday scan for {tf or '1D'}: timed out after {deadline:.0f}s")
+                errors.setdefault(tf, f"timed out after {deadline:.0f}s")
+            break
+        for future in done:
+            tf, paged = pending.pop(future)
+            try:
+                count, df = future.result()
+            except Exception as e:
+                print(f"Error in intraday scan for {tf or '1D'}: {e}")
+                errors.setdefault(tf, str(e) or e.__class__.__name__)
+                continue
+            if tf in errors:
+                continue
+            if df is not None:
+                parts[tf].append(df)
+            if paged:
+                for start in range(shard_size, count, shard_size):
+                    query = build_timeframe_query(tf, settings).order_by('name').offset(start).limit(start + shard_size)
+                    submit(tf, query)
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    frames = {}
+    for tf in tfs:
+        shards = parts.pop(tf)
+        if tf in errors or not shards:
+            frames[tf] = None
+        else:
+            # Pages of a live result can overlap when rows move between requests
+            frames[tf] = pd.concat(shards, ignore_index=True).drop_duplicates(subset=['ticker'], ignore_index=True)
+    return frames, errors
+
+def merge_timeframe_results(frames):
+    """
+    Merges per-timeframe frames, keyed by suffix, into the fired table: one row per symbol,
+    taken from its highest firing timeframe by `tf_order_map`, with `count` and
+    `fired_timeframes` (display names, highest first) giving the multi-timeframe confluence.
+    Rows keep the `fired_timestamp` they were fetched with; unstamped rows get the current time.
+    """
+    all_results = [frames[tf] for tf in timeframes if frames.get(tf) is not None]
     if not all_results:
-        return {"fired": pd.DataFrame()}
+        return pd.DataFrame()
+
+    df_all = pd.concat(all_results, ignore_index=True)
+    rank = df_all['timeframe'].map(tf_order_map).to_numpy()
+    # Each firing timeframe sets one bit, so a single grouped sum gives the confluence set
+    bits = pd.Series(np.left_shift(1, rank), index=df_all.index)
+    unique_pairs = ~df_all.duplicated(subset=['name', 'timeframe']).to_numpy()
+    confluence = bits[unique_pairs].groupby(df_all.loc[unique_pairs, 'name']).sum()
+
+    order = np.argsort(-rank, kind='stable')
+    df_all = df_all.iloc[order].drop_duplicates(subset=['name']).reset_index(drop=True)
+    masks = df_all['name'].map(confluence)
+    labels = {mask: _confluence_labels(mask) for mask in masks.unique()}
 
-    df_all = pd.concat(all_results, ignore_index=True).drop_duplicates(subset=['name'])
     df_all = df_all.rename(columns={'timeframe': 'highest_tf'})
-    df_all['fired_timestamp'] = pd.Timestamp.now()
-    df_all['count'] = 1
-    df_all['previous_volatility'] = 0
-    df_all['current_volatility'] = 0
-    df_all['momentum'] = df_all['MACD.hist'].apply(lambda x: 'Bullish' if x > 0 else ('Bearish' if x < 0 else 'Neutral'))
+    now = pd.Timestamp.now()
+    df_all['fired_timestamp'] = df_all['fired_timestamp'].fillna(now) if 'fired_timestamp' in df_all else now
+    df_all['fired_timeframes'] = masks.map(labels)
+    df_all['count'] = df_all['fired_timeframes'].str.len()
+    return df_all
+
+def _confluence_labels(mask):
+    ranked = sorted(tf_order_map, key=tf_order_map.get, reverse=True)
+    return [tf_display_map[tf] for tf in ranked if mask >> tf_order_map[tf] & 1]
+
+def _fetch_combined(settings, fetch, tfs, tickers=None):
+    try:
+        print("Running combined intraday scan for timeframes: " + ", ".join(tf or '1D' for tf in tfs))
+        query = build_combined_query(settings, tfs, tickers)
+        _, df = fetch(query, tfs)
+    except Exception as e:
+        print(f"Error in combined intraday scan: {e}")
+        error = str(e) or e.__class__.__name__
+        return {tf: None for tf in tfs}, {tf: error for tf in tfs}
+    if df is None or df.empty:
+        return {tf: None for tf in tfs}, {}
+    return split_by_timeframe(df, tfs), {}
+
+def run_intraday_scan(settings, cookies, tfs=None, tracker=None, cache=None, executor=None, tickers=None):
+    """
+    Scans `tfs` (default: every entry in `timeframes`). Returns a dict of:
+
+        fired        - the merged fired table
+        by_timeframe - the per-timeframe frames, so callers can keep timeframes not in this sweep
+        stale        - timeframe -> error for failed queries; they are left out of by_timeframe
+        projection   - the `projection_report` of the queries sent
+        transitions  - the squeeze transitions this sweep caused, when a `tracker` is given
+    """
+    tfs = [tf for tf in timeframes if tf in tfs] if tfs is not None else timeframes
+    if cookies is None or not tfs:
+        results = {"fired": pd.DataFrame(), "by_timeframe": {}, "stale": {}, "projection": projection_report({}, [])}
+        if tracker is not None:
+            # Nothing was observed: empty transitions, state untouched
+            results["transitions"] = tracker.update(None, [])
+        return results
+
+    mode = settings.get('scan_mode', DEFAULT_SCAN_MODE)
+    timeout = settings.get('query_timeout', QUERY_TIMEOUT)
+    fetch = scanner_fetch(cookies, timeout, cache, executor)
+    # Longest one query may take, retries and backoff included
+    deadline = executor.worst_case(timeout) if executor is not None else timeout
+    max_workers = settings.get('max_concurrency', MAX_CONCURRENT_QUERIES)
+    if mode == 'combined':
+        frames, stale = _fetch_combined(settings, fetch, tfs, tickers)
+    elif mode == 'sharded':
+        shard_size = settings.get('shard_size', SHARD_SIZE)
+        frames, stale = _fetch_sharded(settings, fetch, tfs, max_workers, deadline, shard_size, tickers)
+    else:
+        queries = {tf: build_timeframe_query(tf, settings, tickers) for tf in tfs}
+        if mode == 'concurrent':
+            frames, stale = _fetch_concurrent(queries, fetch, max_workers, deadline)
+        else:
+            frames, stale = _fetch_sequential(queries, fetch)
+    frames = {tf: df for tf, df in frames.items() if tf not in stale}
+    # Rows keep the time they were fetched, so a frame retained across sweeps is not re-dated
+    fetched_at = pd.Timestamp.now()
+    # Measured on the raw frames, before enrichment adds columns
+    projection = projection_report(frames, tfs, combined=mode == 'combined')
+
+    # Derived columns are computed per timeframe frame, before the tracker records this
+    # sweep, so previous_volatility is the value from the last time each slot was seen
+    ranked_tfs = sorted(timeframes, key=tf_order_map.get, reverse=True)
+    for tf, df in frames.items():
+        if df is not None and not df.empty:
+            previous = tracker.volatility_of(df[tracker.key], tf) if tracker is not None and tracker.key in df else None
+            frames[tf] = enrich_frame(df, tf, ranked_tfs, previous)
+            frames[tf]['fired_timestamp'] = fetched_at
+
+    transitions = None
+    if tracker is not None:
+        scanned = [f for f in frames.values() if f is not None and not f.empty]
+        # A failed timeframe was not observed; it must not read as every squeeze ending
+        fresh = [tf for tf in tfs if tf not in stale]
+        transitions = tracker.update(pd.concat(scanned, ignore_index=True) if scanned else None, fresh)
 
-    return {"fired": df_all}
+    # Frames outlive the sweep (callers keep the latest per timeframe), so keep them compact
+    frames = {tf: compact_frame(df) for tf, df in frames.items()}
+    results = {"fired": merge_timeframe_results(frames), "by_timeframe": frames, "stale": stale, "projection": projection}
+    if transitions is not None:
+        results["transitions"] = transitions
+    return results
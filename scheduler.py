@@ -0,0 +1,120 @@
+"""
+Bar-close aligned scheduling for the per-timeframe scans.
+
+Each timeframe is scanned shortly after its own bar closes, in exchange-local time,
+instead of every timeframe on one fixed interval. Intraday bars are anchored at the
+session open (NSE: 09:15 IST, so 60m bars close at 10:15, 11:15, ... and the last bar
+is cut short at 15:30). Daily, weekly and monthly bars close at the session close of
+the last trading day of their period. Session times, weekends and holidays come from
+the market's `MarketCalendar`, so nothing is scheduled while the market is shut and the
+close of the session triggers one final sweep of every timeframe.
+"""
+from datetime import timedelta
+
+from market_calendar import get_calendar
+
+# Give the screener a few seconds to publish the closed bar before querying it
+SETTLE_SECONDS = 5
+
+BAR_MINUTES = {'|1': 1, '|3': 3, '|5': 5, '|15': 15, '|30': 30, '|60': 60, '|120': 120, '|240': 240}
+
+# How far back/forward to look for a bar close; covers a monthly bar plus holidays
+_SEARCH_DAYS = 40
+
+
+def bar_closes_on(tf, day, calendar):
+    """All bar close datetimes of timeframe `tf` that fall on `day` (a date), in exchange time."""
+    if not calendar.is_trading_day(day):
+        return []
+    session_open, session_close = calendar.session_bounds(day)
+
+    if tf in BAR_MINUTES:
+        step = timedelta(minutes=BAR_MINUTES[tf])
+        closes = []
+        close = session_open + step
+        while close < session_close:
+            closes.append(close)
+            close += step
+        closes.append(session_close)
+        return closes
+    if tf == '':
+        return [session_close]
+    if tf == '|1W':
+        following = calendar.next_trading_day(day)
+        return [session_close] if day.isocalendar()[:2] != following.isocalendar()[:2] else []
+    if tf == '|1M':
+        following = calendar.next_trading_day(day)
+        return [session_close] if (day.year, day.month) != (following.year, following.month) else []
+    raise ValueError(f"Unknown timeframe suffix: {tf!r}")
+
+
+def last_bar_close(tf, now, calendar):
+    """The most recent bar close of `tf` at or before `now`."""
+    now = now.astimezone(calendar.tz)
+    for offset in range(_SEARCH_DAYS):
+        closes = [c for c in bar_closes_on(tf, now.date() - timedelta(days=offset), calendar) if c <= now]
+        if closes:
+            return closes[-1]
+    return None
+
+
+def next_bar_close(tf, now, calendar):
+    """The first bar close of `tf` strictly after `now`."""
+    now = now.astimezone(calendar.tz)
+    for offset in range(_SEARCH_DAYS):
+        closes = [c for c in bar_closes_on(tf, now.date() + timedelta(days=offset), calendar) if c > now]
+        if closes:
+            return closes[0]
+    return None
+
+
+class BarCloseScheduler:
+    """Tracks, per timeframe, which bar was last scanned and when the next scan is due."""
+
+    def __init__(self, timeframes, calendar=None, settle_seconds=SETTLE_SECONDS):
+        self.timeframes = list(timeframes)
+        self.calendar = calendar or get_calendar('india')
+        self.settle = timedelta(seconds=settle_seconds)
+        self._scanned_bar = {}
+
+    def due(self, now=None):
+        """
+        Timeframes whose latest closed bar has settled and has not been scanned yet, mapped
+        to that bar; pass the entries that were scanned back to `mark_scanned`.
+        """
+        now = now or self.calendar.now()
+        due = {}
+        for tf in self.timeframes:
+            bar = last_bar_close(tf, now - self.settle, self.calendar)
+            # Never-scanned timeframes run once at start-up so the dashboard is populated
+            if tf not in self._scanned_bar or (bar is not None and bar != self._scanned_bar[tf]):
+                due[tf] = bar
+        return due
+
+    def mark_scanned(self, bars):
+        """Records the bars (timeframe -> bar close, as returned by `due`) a sweep scanned."""
+        # The bar due when the sweep started, not the latest one: a bar closing mid-sweep stays due
+        self._scanned_bar.update(bars)
+
+    def next_run(self, now=None):
+        """When the scanner should wake next: the earliest settled bar close after `now`."""
+        now = now or self.calendar.now()
+        if self.due(now):
+            return now
+        closes = (next_bar_close(tf, now - self.settle, self.calendar) for tf in self.timeframes)
+        runs = [close + self.settle for close in closes if close]
+        return min(runs) if runs else None
+
+    def schedule(self, now=None):
+        """Per-timeframe view of the last scanned bar and the next scheduled run."""
+        now = now or self.calendar.now()
+        due = set(self.due(now))
+        schedule = {}
+        for tf in self.timeframes:
+            bar = next_bar_close(tf, now - self.settle, self.calendar)
+            scanned = self._scanned_bar.get(tf)
+            schedule[tf] = {
+                'last_scanned_bar': scanned.isoformat() if scanned else None,
+                'next_run': now.isoformat() if tf in due else (bar + self.settle).isoformat() if bar else None,
+            }
+        return schedule
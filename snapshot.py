@@ -0,0 +1,50 @@
+"""
+Pre-encoded, versioned snapshots of the latest scan results.
+
+The background scanner encodes each sweep once, right after it lands, into an immutable
+`ScanSnapshot` (JSON bytes, optional gzip bytes and an ETag). Request handlers only swap
+a reference to it, so serving `/get_latest_data` costs no DataFrame work and the lock is
+never held while encoding.
+"""
+import gzip
+import hashlib
+from itertools import count
+from time import time
+
+import pandas as pd
+
+from compact import expand_frame
+
+# Compressing once per sweep is cheap; skip it for bodies too small to benefit
+GZIP_MIN_BYTES = 1024
+
+_versions = count(1)
+
+
+class ScanSnapshot:
+    __slots__ = ('version', 'etag', 'body', 'gzip_body', 'created_at')
+
+    def __init__(self, version, etag, body, gzip_body, created_at):
+        self.version = version
+        self.etag = etag
+        self.body = body
+        self.gzip_body = gzip_body
+        self.created_at = created_at
+
+
+def encode_frame(df):
+    """Encodes a DataFrame as a JSON array of records, with NaN as null and ISO timestamps."""
+    if df is None or df.empty:
+        return b'[]'
+    # float32 columns are written with their shortest decimal, not the widened binary value
+    return expand_frame(df).to_json(orient='records', date_format='iso').encode('utf-8')
+
+
+def build_snapshot(results, precompress=True):
+    """Encodes scan results ({"fired": DataFrame, ...}) into a new immutable snapshot."""
+    parts = [b'"' + key.encode('utf-8') + b'":' + encode_frame(df) for key, df in results.items() if isinstance(df, pd.DataFrame)]
+    body = b'{' + b','.join(parts) + b'}'
+    # The ETag follows the content, so an unchanged sweep still revalidates as 304
+    etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+    gzip_body = gzip.compress(body, compresslevel=6) if precompress and len(body) >= GZIP_MIN_BYTES else None
+    return ScanSnapshot(next(_versions), etag, body, gzip_body, time())
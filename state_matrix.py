@@ -0,0 +1,174 @@
+"""
+Symbol x timeframe signal state as bitmasks, for confluence queries.
+
+For every symbol, `StateMatrix` keeps one uint16 per signal (fired, in_squeeze, vol_spike,
+donchian_break, squeeze_breakout) in which bit `tf_order_map[tf]` is set while the signal
+holds on timeframe `tf`. Higher bits are higher timeframes, so:
+
+    popcount(mask)             - on how many timeframes the signal holds
+    highest set bit            - the highest timeframe it holds on
+    mask & required == required - it holds on every required timeframe
+
+all come from a couple of array operations and two small lookup tables over the whole
+universe, instead of concatenating and de-duplicating per-timeframe frames.
+
+Each sweep re-decides the bits of the timeframes it scanned: the firing signals from that
+timeframe's rows (re-evaluated locally with the live filter definitions), in_squeeze from
+every returned row whose bands were observed. Updates build new arrays and swap them in
+whole, so readers never see half a sweep.
+"""
+import numpy as np
+import pandas as pd
+
+from enrichment import squeeze_state
+from evaluator import SnapshotEvaluator
+from scan import build_timeframe_filters, tf_display_map, tf_order_map, tf_suffix_map
+
+SIGNALS = ('fired', 'in_squeeze', 'vol_spike', 'donchian_break', 'squeeze_breakout')
+# Decided by a timeframe's own query; cleared for symbols that did not come back on it
+FIRING_SIGNALS = ('fired', 'vol_spike', 'donchian_break', 'squeeze_breakout')
+
+TF_BITS = {tf: np.uint16(1 << rank) for tf, rank in tf_order_map.items()}
+_MASK_LIMIT = 1 << (max(tf_order_map.values()) + 1)
+# Lookup tables over every possible mask value
+POPCOUNT = np.array([bin(v).count('1') for v in range(_MASK_LIMIT)], dtype=np.uint8)
+HIGHEST_RANK = np.array([v.bit_length() - 1 for v in range(_MASK_LIMIT)], dtype=np.int8)
+_RANK_TF = {rank: tf for tf, rank in tf_order_map.items()}
+
+# numpy >= 2.0 counts bits natively; the table is the fallback
+popcount = getattr(np, 'bitwise_count', POPCOUNT.__getitem__)
+
+_INITIAL_CAPACITY = 1024
+
+
+def timeframe_bits(tfs):
+    """OR of the bits of timeframe suffixes or display names ('1H', 'Weekly'); raises ValueError on unknown ones."""
+    mask = 0
+    for tf in tfs:
+        suffix = tf_suffix_map.get(tf, tf)
+        if suffix not in TF_BITS:
+            raise ValueError(f"Unknown timeframe: {tf!r}")
+        mask |= int(TF_BITS[suffix])
+    return np.uint16(mask)
+
+
+def mask_labels(mask):
+    """Display names of the timeframes set in `mask`, highest first."""
+    return [tf_display_map[_RANK_TF[rank]] for rank in sorted(_RANK_TF, reverse=True) if int(mask) >> rank & 1]
+
+
+class StateMatrix:
+    def __init__(self, key='ticker'):
+        self.key = key
+        self.sweeps = 0
+        # (symbols, index, masks[len(SIGNALS), capacity]) swapped as one reference; each
+        # signal's masks are contiguous so a query scans one flat array
+        self._state = (np.array([], dtype=object), pd.Index([], dtype=object),
+                       np.zeros((len(SIGNALS), _INITIAL_CAPACITY), dtype=np.uint16))
+
+    def __len__(self):
+        return len(self._state[0])
+
+    @staticmethod
+    def _with_rows(state, symbols):
+        """(state with rows for unseen `symbols`, row of each symbol)."""
+        names, index, masks = state
+        rows = index.get_indexer(symbols)
+        new = pd.unique(symbols[rows < 0])
+        if len(new):
+            names = np.concatenate([names, np.asarray(new, dtype=object)])
+            index = pd.Index(names, dtype=object)
+            if len(names) > masks.shape[1]:
+                capacity = masks.shape[1]
+                while capacity < len(names):
+                    capacity *= 2
+                grown = np.zeros((len(SIGNALS), capacity), dtype=np.uint16)
+                grown[:, :masks.shape[1]] = masks
+                masks = grown
+            rows = index.get_indexer(symbols)
+        return (names, index, masks), rows
+
+    def update(self, frames, tfs):
+        """
+        Applies one sweep: `frames` maps each scanned timeframe suffix in `tfs` to the rows
+        that fired on it (or None), as in `run_intraday_scan(...)["by_timeframe"]`.
+        """
+        names, index, masks = self._state
+        state = (names, index, masks.copy())
+        n = len(names)
+        firing = [SIGNALS.index(s) for s in FIRING_SIGNALS]
+        for tf in tfs:
+            if tf not in TF_BITS:
+                continue
+            bit = TF_BITS[tf]
+            state[2][firing, :n] &= ~bit
+            df = frames.get(tf)
+            if df is None or df.empty or self.key not in df:
+                continue
+            state, rows = self._with_rows(state, df[self.key].to_numpy(dtype=object))
+            evaluator = SnapshotEvaluator(df)
+            signals = build_timeframe_filters(tf)
+            state[2][SIGNALS.index('fired'), rows] |= bit
+            for name in ('vol_spike', 'donchian_break', 'squeeze_breakout'):
+                hit = np.asarray(evaluator.evaluate(signals[name]), dtype=bool)
+                state[2][SIGNALS.index(name), rows[hit]] |= bit
+
+        returned = [df for df in frames.values() if df is not None and not df.empty and self.key in df]
+        if returned:
+            seen = pd.concat(returned, ignore_index=True).drop_duplicates(subset=[self.key])
+            state, rows = self._with_rows(state, seen[self.key].to_numpy(dtype=object))
+            column = SIGNALS.index('in_squeeze')
+            for tf in tfs:
+                if tf not in TF_BITS:
+                    continue
+                in_squeeze, observed, _ = squeeze_state(seen, tf)
+                # Only observed slots change; the rest keep their last known state
+                r = rows[observed]
+                state[2][column, r] &= ~TF_BITS[tf]
+                state[2][column, r[in_squeeze[observed]]] |= TF_BITS[tf]
+        self._state = state
+        self.sweeps += 1
+
+    def masks(self, signal='fired'):
+        """(symbols, uint16 mask per symbol) for `signal`."""
+        names, _, masks = self._state
+        return names, masks[SIGNALS.index(signal), :len(names)]
+
+    def select(self, signal='fired', min_count=1, include=(), exclude=()):
+        """
+        (symbols, masks) of the symbols whose `signal` holds on at least `min_count`
+        timeframes, on every timeframe in `include` and on none in `exclude`.
+        """
+        if signal not in SIGNALS:
+            raise ValueError(f"Unknown signal: {signal!r}")
+        symbols, masks = self.masks(signal)
+        required, excluded = timeframe_bits(include), timeframe_bits(exclude)
+        hit = (popcount(masks) >= min_count) & ((masks & required) == required) & ((masks & excluded) == 0)
+        return symbols[hit], masks[hit]
+
+    def confluence(self, signal='fired', min_count=1, include=(), exclude=(), limit=None):
+        """
+        The selected symbols as a DataFrame of (key, count, highest_tf, timeframes), most
+        timeframes first, then highest timeframe.
+        """
+        symbols, masks = self.select(signal, min_count, include, exclude)
+        counts, ranks = POPCOUNT[masks], HIGHEST_RANK[masks]
+        order = np.lexsort((-ranks.astype(int), -counts.astype(int)))
+        if limit is not None:
+            order = order[:limit]
+        labels = {int(m): mask_labels(m) for m in np.unique(masks[order])}
+        return pd.DataFrame({
+            self.key: symbols[order],
+            'count': counts[order].astype(int),
+            'highest_tf': [labels[int(m)][0] if labels[int(m)] else None for m in masks[order]],
+            'timeframes': [labels[int(m)] for m in masks[order]],
+        })
+
+    def stats(self):
+        names, _, masks = self._state
+        active = masks[:, :len(names)]
+        return {
+            'symbols': len(names),
+            'sweeps': self.sweeps,
+            'active': {signal: int(np.count_nonzero(active[i])) for i, signal in enumerate(SIGNALS)},
+        }
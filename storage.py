@@ -0,0 +1,249 @@
+"""
+SQLite persistence for scan sweeps.
+
+Each sweep becomes one row in the `scans` table (the same table the flask scanner writes
+to), carrying the raw per-timeframe results as a compressed columnar payload instead of
+`results_json`. Every fired symbol also gets a row in the indexed `fired_events` table.
+Writes are queued and applied by a background thread on a WAL-mode connection, so the
+scanner thread never waits on disk.
+
+Payloads are Parquet (zstd) when pyarrow is installed. Otherwise numeric, boolean and
+datetime columns are written as raw NumPy blocks, one per dtype, and text columns as
+int32 codes into the distinct values a small zlib-compressed JSON header carries.
+Reading a sweep back is then a `frombuffer` per block rather than a JSON parse of every
+value. The format is stored next to each payload, and payloads written as zlib-compressed
+column-oriented JSON by earlier versions still read back.
+"""
+import io
+import json
+import os
+import queue
+import sqlite3
+import threading
+import zlib
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from compact import expand_frame
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+DB_PATH = os.environ.get('TV_SCANNER_DB', 'tv_scanner.db')
+
+PARQUET_FORMAT = 'parquet-zstd'
+JSON_COLUMNS_FORMAT = 'json-columns-zlib'
+NUMPY_BLOCKS_FORMAT = 'numpy-blocks'
+
+FIRED_EVENT_COLUMNS = ['ticker', 'name', 'timeframe', 'close', 'momentum']
+
+
+def pack_frame(df):
+    """Serializes a DataFrame into (format, columnar bytes)."""
+    if HAS_PYARROW:
+        buf = io.BytesIO()
+        expand_frame(df).to_parquet(buf, compression='zstd', index=False)
+        return PARQUET_FORMAT, buf.getvalue()
+    # Numeric columns are grouped into one (columns x rows) block per dtype; float32
+    # indicators stay float32, which is all the precision the compact frames hold. Text
+    # columns are dictionary-encoded: distinct values in the header, int32 codes (-1 for
+    # missing) in a block of their own. Anything unhashable is kept as a JSON list.
+    blocks, text, codes, objects = {}, [], [], []
+    for name in df.columns:
+        series = df[name]
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufM':
+            blocks.setdefault(series.dtype.str, []).append(name)
+            continue
+        values = series.astype(object).where(series.notna(), None)
+        try:
+            column_codes, uniques = pd.factorize(values)
+        except TypeError:
+            objects.append([name, values.tolist()])
+            continue
+        text.append([name, list(uniques)])
+        codes.append(column_codes.astype(np.int32))
+    header = {'rows': len(df), 'columns': list(df.columns), 'blocks': list(blocks.items()), 'text': text, 'objects': objects}
+    header = zlib.compress(json.dumps(header, default=str).encode('utf-8'), 6)
+    # Float buffers barely compress, and decompressing them would dominate reading a sweep back
+    buffers = [np.ascontiguousarray(df[names].to_numpy(dtype=np.dtype(dtype)).T).tobytes() for dtype, names in blocks.items()]
+    buffers.extend(c.tobytes() for c in codes)
+    return NUMPY_BLOCKS_FORMAT, len(header).to_bytes(4, 'little') + header + b''.join(buffers)
+
+
+def _unpack_blocks(payload):
+    size = int.from_bytes(payload[:4], 'little')
+    header = json.loads(zlib.decompress(payload[4:4 + size]))
+    n, offset, blocks = header['rows'], 4 + size, []
+    for dtype, names in header['blocks']:
+        count = len(names) * n
+        blocks.append((dtype, names, np.frombuffer(payload, dtype=dtype, count=count, offset=offset).reshape(len(names), n)))
+        offset += count * np.dtype(dtype).itemsize
+    codes = np.frombuffer(payload, dtype=np.int32, count=len(header['text']) * n, offset=offset).reshape(len(header['text']), n)
+    text = {name: (uniques, codes[i]) for i, (name, uniques) in enumerate(header['text'])}
+    return header, blocks, text
+
+
+def text_values(uniques, codes):
+    """Decodes a dictionary-encoded text column into a list, with None for missing values."""
+    return np.append(np.asarray(uniques, dtype=object), None)[codes].tolist()
+
+
+def unpack_blocks(fmt, payload):
+    """
+    Decodes a payload into (blocks, text, objects, row count) without building a DataFrame:
+    blocks are (dtype, column names, array of one row per column), text maps a column to
+    (distinct values, int32 codes with -1 for missing), objects map a column to a list.
+    """
+    if fmt == NUMPY_BLOCKS_FORMAT:
+        header, blocks, text = _unpack_blocks(payload)
+        return blocks, text, dict(header['objects']), header['rows']
+    data, n = unpack_columns(fmt, payload)
+    blocks, objects = [], {}
+    for name, values in data.items():
+        if isinstance(values, np.ndarray) and values.dtype.kind in 'biufM':
+            blocks.append((values.dtype.str, [name], values.reshape(1, n)))
+        else:
+            objects[name] = list(values)
+    return blocks, {}, objects, n
+
+
+def unpack_columns(fmt, payload):
+    """Decodes a payload into (column name -> sequence of values, row count) without building a DataFrame."""
+    if fmt == PARQUET_FORMAT:
+        import pyarrow.parquet as pq
+        table = pq.read_table(io.BytesIO(payload))
+        return {name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names}, table.num_rows
+    if fmt == NUMPY_BLOCKS_FORMAT:
+        header, blocks, text = _unpack_blocks(payload)
+        data = {name: block[i] for _, names, block in blocks for i, name in enumerate(names)}
+        data.update((name, text_values(uniques, codes)) for name, (uniques, codes) in text.items())
+        data.update(header['objects'])
+        return {name: data[name] for name in header['columns']}, header['rows']
+    if fmt == JSON_COLUMNS_FORMAT:
+        data = json.loads(zlib.decompress(payload))['data']
+        return data, len(next(iter(data.values()), ()))
+    raise ValueError(f"Unknown payload format: {fmt}")
+
+
+def unpack_frame(fmt, payload):
+    if fmt == PARQUET_FORMAT:
+        return pd.read_parquet(io.BytesIO(payload))
+    if fmt == NUMPY_BLOCKS_FORMAT:
+        data, _ = unpack_columns(fmt, payload)
+        return pd.DataFrame(data)
+    if fmt == JSON_COLUMNS_FORMAT:
+        data = json.loads(zlib.decompress(payload))
+        return pd.DataFrame(data['data'], columns=data['columns'])
+    raise ValueError(f"Unknown payload format: {fmt}")
+
+
+def connect(db_path=DB_PATH):
+    """Opens the scanner database in WAL mode and makes sure the sweep schema exists."""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('''CREATE TABLE IF NOT EXISTS scans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts_utc TEXT NOT NULL,
+        market TEXT,
+        timeframe TEXT,
+        params_json TEXT,
+        results_json TEXT
+    )''')
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(scans)')}
+    if 'payload_format' not in columns:
+        conn.execute('ALTER TABLE scans ADD COLUMN payload_format TEXT')
+    if 'payload' not in columns:
+        conn.execute('ALTER TABLE scans ADD COLUMN payload BLOB')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_scans_ts ON scans(ts_utc)')
+    conn.execute('''CREATE TABLE IF NOT EXISTS fired_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scan_id INTEGER NOT NULL REFERENCES scans(id),
+        ts_utc TEXT NOT NULL,
+        ticker TEXT,
+        name TEXT,
+        timeframe TEXT,
+        close REAL,
+        momentum TEXT
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_fired_events_name_ts ON fired_events(name, ts_utc)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_fired_events_tf_ts ON fired_events(timeframe, ts_utc)')
+    conn.commit()
+    return conn
+
+
+class SweepStore:
+    """Queues sweeps and writes them from a single background thread."""
+
+    def __init__(self, db_path=DB_PATH, max_pending=64):
+        self.db_path = db_path
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, settings, frames, fired, ts=None):
+        """
+        Queues one sweep: `frames` maps timeframe suffix -> raw frame (or None) and `fired`
+        is the merged fired table. Never blocks; a sweep is dropped if the writer is backed up.
+        """
+        self._ensure_started()
+        ts = ts or datetime.now(timezone.utc)
+        try:
+            self._queue.put_nowait((ts, dict(settings), dict(frames), fired))
+        except queue.Full:
+            print("Warning: sweep store is backed up; dropping this sweep from history.")
+
+    def close(self, timeout=10):
+        """Flushes queued sweeps and stops the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sweep-store', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conn = connect(self.db_path)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                try:
+                    self._write(conn, *item)
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Error persisting sweep: {e}")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _write(conn, ts, settings, frames, fired):
+        ts_utc = ts.isoformat()
+        scanned = [f for f in frames.values() if f is not None and not f.empty]
+        raw = pd.concat(scanned, ignore_index=True) if scanned else pd.DataFrame()
+        fmt, payload = pack_frame(raw)
+
+        cur = conn.execute(
+            'INSERT INTO scans(ts_utc, market, timeframe, params_json, results_json, payload_format, payload) VALUES (?,?,?,?,?,?,?)',
+            (ts_utc, settings.get('market'), ','.join(frames), json.dumps(settings, default=str), None, fmt, payload),
+        )
+        scan_id = cur.lastrowid
+
+        if fired is not None and not fired.empty:
+            events = expand_frame(fired).rename(columns={'highest_tf': 'timeframe'}).reindex(columns=FIRED_EVENT_COLUMNS)
+            events = events.astype(object).where(events.notna(), None)
+            conn.executemany(
+                'INSERT INTO fired_events(scan_id, ts_utc, ticker, name, timeframe, close, momentum) VALUES (?,?,?,?,?,?,?)',
+                [(scan_id, ts_utc, *row) for row in events.itertuples(index=False, name=None)],
+            )
+        conn.commit()
@@ -0,0 +1,93 @@
+"""
+Server-Sent Events fan-out of scan results.
+
+After each sweep the background scanner hands the new snapshot to `SweepBroadcaster`,
+which diffs its fired records against the previous sweep by symbol and pushes one
+`delta` event (added, updated and removed symbols) to every connected client. A client
+that connects mid-session first receives a full `snapshot` event.
+"""
+import json
+import queue
+import threading
+
+# A client this far behind is dropped; its EventSource reconnects and gets a fresh snapshot
+MAX_PENDING_EVENTS = 16
+KEEPALIVE_SECONDS = 15
+
+
+def format_event(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append('data: ' + json.dumps(data, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+class SweepBroadcaster:
+    def __init__(self, key='name'):
+        self.key = key
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._records = {}
+        self._version = 0
+        self._etag = None
+
+    def subscribe(self):
+        """Registers a client and queues the current state as its first event."""
+        q = queue.Queue(maxsize=MAX_PENDING_EVENTS)
+        with self._lock:
+            q.put_nowait(format_event('snapshot', {'version': self._version, 'fired': list(self._records.values())}, self._version))
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, snapshot):
+        """Diffs the snapshot's fired records against the previous sweep and pushes the delta."""
+        if snapshot.etag == self._etag:
+            # Same content as the last sweep: nothing to diff or push
+            with self._lock:
+                self._version = snapshot.version
+            return {'version': snapshot.version, 'added': [], 'updated': [], 'removed': []}
+        records = {r[self.key]: r for r in json.loads(snapshot.body).get('fired', []) if r.get(self.key) is not None}
+        with self._lock:
+            previous = self._records
+            delta = {
+                'version': snapshot.version,
+                'added': [r for k, r in records.items() if k not in previous],
+                'updated': [r for k, r in records.items() if k in previous and previous[k] != r],
+                'removed': [k for k in previous if k not in records],
+            }
+            self._records = records
+            self._version = snapshot.version
+            self._etag = snapshot.etag
+            if not (delta['added'] or delta['updated'] or delta['removed']):
+                return delta
+            message = format_event('delta', delta, snapshot.version)
+            for q in list(self._subscribers):
+                try:
+                    q.put_nowait(message)
+                except queue.Full:
+                    self._subscribers.discard(q)
+                    # Wake the client's generator so it ends the response
+                    with q.mutex:
+                        q.queue.clear()
+                    q.put_nowait(None)
+        return delta
+
+    def events(self, q):
+        """Yields SSE messages for one subscriber until it is dropped or disconnects."""
+        try:
+            while True:
+                try:
+                    message = q.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(q)
@@ -0,0 +1,201 @@
+"""
+In-memory squeeze state per (symbol, timeframe) and the transitions between sweeps.
+
+A symbol is in a squeeze on a timeframe when its Bollinger Bands sit inside its Keltner
+Channel. `TransitionTracker` keeps that flag, plus the band width relative to ATR
+("volatility"), in packed arrays with one row per symbol and one column per timeframe, and
+diffs every sweep against them:
+
+    formed  - entered a squeeze since the last observation
+    fired   - left a squeeze with volatility expanding
+    ended   - left a squeeze without volatility expanding
+
+Only slots a sweep actually observed (all four bands present for a returned symbol on a
+scanned timeframe) are compared and updated; everything else keeps its last known state.
+The state is checkpointed to a local `.npz` file by a background thread, so a restart
+resumes from the last sweep without any database on the scan path.
+"""
+import os
+import queue
+import threading
+
+import numpy as np
+import pandas as pd
+
+from enrichment import squeeze_state
+
+TRANSITIONS = ('formed', 'fired', 'ended')
+TRANSITION_COLUMNS = ['timeframe', 'previous_volatility', 'current_volatility']
+
+_INITIAL_CAPACITY = 1024
+
+
+class TransitionTracker:
+    """Squeeze state table keyed by symbol and timeframe suffix."""
+
+    def __init__(self, timeframes, checkpoint_path=None, key='ticker'):
+        self.timeframes = list(timeframes)
+        self.key = key
+        self.checkpoint_path = checkpoint_path
+        self._columns = {tf: i for i, tf in enumerate(self.timeframes)}
+        self._symbols = []
+        self._index = pd.Index([], dtype=object)
+        shape = (_INITIAL_CAPACITY, len(self.timeframes))
+        self._in_squeeze = np.zeros(shape, dtype=bool)
+        self._volatility = np.zeros(shape, dtype=float)
+        self._queue = queue.Queue(maxsize=1)
+        self._thread = None
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self.load(checkpoint_path)
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def _rows_for(self, symbols):
+        """Row of each symbol in the state arrays, adding rows for symbols not seen before."""
+        rows = self._index.get_indexer(symbols)
+        new = pd.unique(symbols[rows < 0])
+        if len(new):
+            self._grow(len(self._symbols) + len(new))
+            self._symbols.extend(new)
+            self._index = pd.Index(self._symbols, dtype=object)
+            rows = self._index.get_indexer(symbols)
+        return rows
+
+    def _grow(self, size):
+        capacity = len(self._in_squeeze)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in ('_in_squeeze', '_volatility'):
+            old = getattr(self, name)
+            grown = np.zeros((capacity, old.shape[1]), dtype=old.dtype)
+            grown[:len(old)] = old
+            setattr(self, name, grown)
+
+    def update(self, frame, tfs=None):
+        """
+        Applies one sweep's raw rows for the scanned timeframes `tfs` and returns
+        {'formed', 'fired', 'ended'} DataFrames of (key, timeframe, previous_volatility,
+        current_volatility).
+        """
+        empty = pd.DataFrame(columns=[self.key] + TRANSITION_COLUMNS)
+        if frame is None or frame.empty or self.key not in frame:
+            return {t: empty for t in TRANSITIONS}
+        frame = frame.drop_duplicates(subset=[self.key])
+        symbols = frame[self.key].to_numpy(dtype=object)
+        rows = self._rows_for(symbols)
+
+        parts = {t: [] for t in TRANSITIONS}
+        for tf in tfs if tfs is not None else self.timeframes:
+            if tf not in self._columns:
+                continue
+            c = self._columns[tf]
+            in_squeeze, observed, volatility = squeeze_state(frame, tf)
+            r = rows[observed]
+            now, current = in_squeeze[observed], volatility[observed]
+            was, previous = self._in_squeeze[r, c], self._volatility[r, c]
+
+            left = was & ~now
+            expanding = current > previous
+            masks = {'formed': now & ~was, 'fired': left & expanding, 'ended': left & ~expanding}
+            for transition, mask in masks.items():
+                if mask.any():
+                    parts[transition].append(pd.DataFrame({
+                        self.key: symbols[observed][mask],
+                        'timeframe': tf,
+                        'previous_volatility': previous[mask],
+                        'current_volatility': current[mask],
+                    }))
+
+            self._in_squeeze[r, c] = now
+            self._volatility[r, c] = current
+
+        self.checkpoint()
+        return {t: pd.concat(p, ignore_index=True) if p else empty for t, p in parts.items()}
+
+    def volatility_of(self, symbols, tf):
+        """Last recorded volatility of each symbol on `tf` (0 where never observed)."""
+        rows = self._index.get_indexer(np.asarray(symbols, dtype=object))
+        c = self._columns.get(tf)
+        if c is None:
+            return np.zeros(len(rows))
+        return np.where(rows >= 0, self._volatility[rows, c], 0.0)
+
+    def in_squeeze(self):
+        """Long DataFrame of every (key, timeframe) currently known to be in a squeeze."""
+        n = len(self._symbols)
+        rows, cols = np.nonzero(self._in_squeeze[:n])
+        return pd.DataFrame({
+            self.key: np.asarray(self._symbols, dtype=object)[rows],
+            'timeframe': np.asarray(self.timeframes, dtype=object)[cols],
+            'volatility': self._volatility[rows, cols],
+        })
+
+    def checkpoint(self):
+        """Queues the current state for the checkpoint writer; a pending older state is replaced."""
+        if not self.checkpoint_path:
+            return
+        n = len(self._symbols)
+        state = {
+            'symbols': np.asarray(self._symbols, dtype=str),
+            'timeframes': np.asarray(self.timeframes, dtype=str),
+            'in_squeeze': self._in_squeeze[:n].copy(),
+            'volatility': self._volatility[:n].copy(),
+        }
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='squeeze-checkpoint', daemon=True)
+            self._thread.start()
+        while True:
+            try:
+                self._queue.put_nowait(state)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def close(self, timeout=10):
+        """Writes any pending checkpoint and stops the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            state = self._queue.get()
+            if state is None:
+                return
+            try:
+                self._write(self.checkpoint_path, state)
+            except Exception as e:
+                print(f"Error writing squeeze state checkpoint: {e}")
+
+    @staticmethod
+    def _write(path, state):
+        # Write then rename, so a crash mid-write never leaves a truncated checkpoint
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **state)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """Restores state from a checkpoint; timeframes no longer tracked are ignored."""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                symbols = data['symbols'].tolist()
+                saved_tfs = data['timeframes'].tolist()
+                in_squeeze, volatility = data['in_squeeze'], data['volatility']
+        except Exception as e:
+            print(f"Warning: could not load squeeze state from {path}: {e}")
+            return
+        rows = self._rows_for(np.asarray(symbols, dtype=object))
+        for j, tf in enumerate(saved_tfs):
+            c = self._columns.get(tf)
+            if c is not None:
+                self._in_squeeze[rows, c] = in_squeeze[:, j]
+                self._volatility[rows, c] = volatility[:, j]
+        print(f"Loaded squeeze state for {len(symbols)} symbols from {path}.")
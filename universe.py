@@ -0,0 +1,140 @@
+"""
+Daily eligible-universe resolution for the intraday sweeps.
+
+The scan's base filters (beta, primary listing, common stock, exchange, active) barely move
+within a session, yet every per-timeframe query asked the screener to re-apply them. A
+`Universe` resolves the tickers passing them once per trading session, caches the list on
+disk, and the sweep queries are then restricted to it with `set_tickers` and carry only the
+signal filters.
+
+A cached list is valid for the session it was resolved in: it is reused across restarts
+and pre-market, and re-resolved once the next session has opened, or as soon as the market
+or the filters change. If resolving fails, the last list is kept (with a warning); without
+any list the caller falls back to filtering server-side.
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from tradingview_screener import And, Query
+
+import http_session
+from market_calendar import get_calendar
+
+DEFAULT_UNIVERSE_FILE = 'universe.json'
+# Upper bound on the universe query; a larger match is treated as unresolved, never truncated
+UNIVERSE_LIMIT = 5000
+
+
+def build_universe_query(filters, market, limit=UNIVERSE_LIMIT):
+    return Query().select('name').where2(And(*filters)).set_markets(market).limit(limit)
+
+
+def universe_key(filters, market):
+    """Identifies a universe by its market and the compiled filter payload."""
+    payload = json.dumps(build_universe_query(filters, market).query, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def session_date(calendar, now=None):
+    """The trading day of the latest session open at or before `now`."""
+    now = (now or calendar.now()).astimezone(calendar.tz)
+    day = now.date()
+    for _ in range(366):
+        if calendar.is_trading_day(day) and calendar.session_bounds(day)[0] <= now:
+            return day
+        day -= timedelta(days=1)
+    return None
+
+
+class Universe:
+    def __init__(self, filters, path=DEFAULT_UNIVERSE_FILE, calendar=None, fetch=None):
+        self.filters = list(filters)
+        self.path = path
+        self.calendar = calendar or get_calendar('india')
+        self.fetch = fetch or http_session.get_scanner_data
+        self.resolved = 0
+        self._entry = None
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Reads the cached universe from disk, if any."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                self._entry = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not read universe cache {self.path}: {e}")
+
+    def _save(self, entry):
+        if not self.path:
+            return
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, self.path)
+
+    def resolve(self, market, cookies=None, timeout=http_session.DEFAULT_TIMEOUT):
+        """Queries the tickers passing the filters on `market`; returns them sorted."""
+        count, df = self.fetch(build_universe_query(self.filters, market), cookies=cookies, timeout=timeout)
+        tickers = sorted(df['ticker'].astype(str)) if df is not None and not df.empty else []
+        if count > len(tickers):
+            raise ValueError(f"universe has {count} symbols, more than the {len(tickers)} returned")
+        return tickers
+
+    def tickers(self, settings, cookies=None, timeout=http_session.DEFAULT_TIMEOUT):
+        """
+        The eligible tickers for this session, resolved when the cached list is from an
+        earlier session or for other filters. None when no list is available.
+        """
+        market = settings['market']
+        key = universe_key(self.filters, market)
+        session = session_date(self.calendar)
+        session = session.isoformat() if session else None
+        with self._lock:
+            entry = self._entry
+            if entry is not None and entry['key'] == key and entry['session'] == session:
+                return entry['tickers']
+            try:
+                tickers = self.resolve(market, cookies, timeout)
+            except Exception as e:
+                if entry is not None and entry['key'] == key:
+                    print(f"Warning: could not refresh the universe ({e}); using the list from {entry['session']}")
+                    return entry['tickers']
+                print(f"Warning: could not resolve the universe ({e}); filtering server-side")
+                return None
+            if not tickers:
+                print("Warning: the universe query matched no symbols; filtering server-side")
+                return None
+            entry = {
+                'key': key,
+                'market': market,
+                'session': session,
+                'resolved_at': datetime.now(self.calendar.tz).isoformat(),
+                'tickers': tickers,
+            }
+            self._entry = entry
+            self.resolved += 1
+            print(f"Resolved universe for {market} session {session}: {len(tickers)} symbols")
+            try:
+                self._save(entry)
+            except OSError as e:
+                print(f"Warning: could not write universe cache {self.path}: {e}")
+            return tickers
+
+    def stats(self):
+        with self._lock:
+            entry = self._entry
+        if entry is None:
+            return {'symbols': 0, 'session': None, 'resolved_at': None, 'resolved': self.resolved}
+        return {
+            'symbols': len(entry['tickers']),
+            'market': entry['market'],
+            'session': entry['session'],
+            'resolved_at': entry['resolved_at'],
+            'resolved': self.resolved,
+        }